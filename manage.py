@@ -1,8 +1,9 @@
+import time
 import unittest
 import coverage
 
 from flask_script import Manager, Server
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import Migrate, MigrateCommand, stamp
 
 COV = coverage.coverage(
     branch=True,
@@ -15,10 +16,12 @@ COV = coverage.coverage(
 )
 COV.start()
 
-from project import app, db, settings # noqa
+from project import app, db, bcrypt, settings # noqa
 from project.api.models import (
     User, Education, Group, Role, Tag, Project,
-    Location, Customer, ProjectResponse, ContactPerson)  # noqa
+    Location, Customer, ProjectResponse, ContactPerson,
+    WorkExperience, Activity, BlacklistToken, ActivityOutbox, FeedItem,
+    role_closure, group_closure, searchable, update_descriptive)  # noqa
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -53,6 +56,9 @@ def add_admin_account():
 def create_db():
     """Creates the db tables."""
     db.create_all()
+    create_activity_partitions()
+    # create_all already builds the current schema, mark it as migrated
+    stamp()
     add_admin_account()
     # add_test_data()
 
@@ -168,6 +174,145 @@ def add_test_data():
     db.session.commit()
 
 
+@manager.command
+def convert_blacklist():
+    """Converts blacklisted tokens from the old whole-token layout."""
+    converted = BlacklistToken.convert_legacy(db.session.connection())
+    db.session.commit()
+    print('Converted {} blacklisted tokens'.format(converted))
+
+
+@manager.command
+def prune_blacklist():
+    """Deletes blacklisted tokens that have already expired."""
+    deleted = BlacklistToken.prune()
+    print('Pruned {} expired blacklisted tokens'.format(deleted))
+
+
+@manager.command
+def benchmark_bcrypt(target_ms=250, max_rounds=16):
+    """Measures bcrypt hash times and recommends BCRYPT_LOG_ROUNDS."""
+    target_ms = float(target_ms)
+    recommended = None
+    for rounds in range(4, int(max_rounds) + 1):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            bcrypt.generate_password_hash('benchmark', rounds)
+            timings.append((time.perf_counter() - start) * 1000)
+        elapsed = sorted(timings)[1]
+        print('rounds={:2d}  {:9.1f} ms'.format(rounds, elapsed))
+        if elapsed > target_ms:
+            break
+        recommended = rounds
+    if recommended is None:
+        print('No cost meets a {} ms target on this machine'.format(
+            target_ms))
+        return
+    print('Recommended BCRYPT_LOG_ROUNDS = {} (target {} ms, current {})'
+          .format(recommended, target_ms, app.config['BCRYPT_LOG_ROUNDS']))
+
+
+@manager.command
+def refresh_descriptive():
+    """Recomputes the stored _descriptive label of every row."""
+    for model in [User, Role, Group, Location, ContactPerson, Customer,
+                  Project, ProjectResponse, Education, WorkExperience]:
+        labels = [(item.id, item.describe()) for item in model.query.all()]
+        update_descriptive(
+            db.session.connection(), model.__table__, labels)
+        print('Refreshed {} {} labels'.format(len(labels), model.__name__))
+    db.session.commit()
+
+
+@manager.command
+def rebuild_closures():
+    """Rebuilds the group and role hierarchy closure tables."""
+    connection = db.session.connection()
+    group_closure.rebuild(connection, dict(
+        db.session.query(Group.id, Group.main_group_id).all()))
+    role_closure.rebuild(connection, dict(
+        db.session.query(Role.id, Role.main_role_id).all()))
+    db.session.commit()
+
+
+@manager.command
+def process_activity_outbox(batch_size=500, loop=False, interval=1):
+    """Expands queued changes into activities, optionally forever."""
+    while True:
+        processed = ActivityOutbox.process(int(batch_size))
+        if processed:
+            print('Processed {} outbox entries'.format(processed))
+            continue
+        if not loop:
+            return
+        time.sleep(float(interval))
+
+
+@manager.command
+def benchmark_activities(count=10000):
+    """Compares ORM and multi-row inserts of work experience activities."""
+    count = int(count)
+    user = User(**{
+        'email': 'benchmark-{}@skillocate.com'.format(time.time()),
+        'password': 'benchmark',
+        'name': 'Benchmark'
+    })
+    db.session.add(user)
+    db.session.flush()
+    db.session.bulk_insert_mappings(WorkExperience, [
+        {'title': 'Experience {}'.format(i), 'employer': 'Benchmark',
+         'user_id': user.id} for i in range(count)])
+    experiences = WorkExperience.query.filter_by(user_id=user.id).all()
+    rows = [experience.activity_values(None) for experience in experiences]
+
+    savepoint = db.session.begin_nested()
+    start = time.perf_counter()
+    for row in rows:
+        db.session.add(Activity(**row))
+    db.session.flush()
+    orm = time.perf_counter() - start
+    savepoint.rollback()
+
+    start = time.perf_counter()
+    Activity.insert_many(db.session, rows)
+    bulk = time.perf_counter() - start
+
+    db.session.rollback()
+    print('ORM unit of work:  {:8.1f} ms'.format(orm * 1000))
+    print('Multi-row INSERT:  {:8.1f} ms'.format(bulk * 1000))
+    print('Speedup:           {:8.1f}x'.format(orm / bulk))
+
+
+@manager.command
+def create_search_indexes():
+    """Adds the full-text search columns and indexes to an existing db."""
+    for model in searchable.values():
+        for statement in model.search_ddl():
+            db.session.execute(statement)
+    db.session.commit()
+
+
+@manager.command
+def create_activity_partitions(months_ahead=3):
+    """Creates monthly activity partitions ahead of time."""
+    Activity.create_partitions(db.session.connection(), int(months_ahead))
+    db.session.commit()
+
+
+@manager.command
+def drop_activity_partitions(keep_months=24):
+    """Drops activity partitions older than the retention period."""
+    dropped = Activity.drop_partitions(
+        db.session.connection(), int(keep_months))
+    db.session.commit()
+    for name in dropped:
+        print('Dropped {}'.format(name))
+
+    pruned = FeedItem.prune(Activity.retention_cutoff(int(keep_months)))
+    print('Pruned {} feed items'.format(pruned))
+
+
 @manager.command
 def drop_db():
     """Drops the db tables."""
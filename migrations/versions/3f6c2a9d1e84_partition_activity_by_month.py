@@ -0,0 +1,120 @@
+"""Partition activity by month
+
+Converts an activity table created before partitioning into a table
+partitioned by RANGE (created), with a DEFAULT partition, a partition for
+every month that has rows plus the next three, and the (user_id, created)
+and (project_id, created) indexes. Ids keep coming from the existing
+sequence. Databases created with `manage.py create_db` are already
+partitioned and are left alone.
+
+Revision ID: 3f6c2a9d1e84
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2a9d1e84'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = (
+    'id, created, user_id, project_response_id, project_id, education_id, '
+    'work_experience_id, customer_id, action, origin, target')
+
+
+def is_partitioned(bind):
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'activity'")).scalar() is not None
+
+
+def create_month(year, month):
+    index = year * 12 + month
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS activity_y{0:04d}m{1:02d} "
+        "PARTITION OF activity FOR VALUES FROM ('{0:04d}-{1:02d}-01') "
+        "TO ('{2:04d}-{3:02d}-01')".format(
+            year, month, index // 12, index % 12 + 1))
+
+
+def upgrade():
+    bind = op.get_bind()
+    if is_partitioned(bind):
+        # Created by create_db; create_activity_partitions keeps it up
+        return
+
+    today = datetime.date.today()
+    months = set()
+    for offset in range(MONTHS_AHEAD + 1):
+        index = today.year * 12 + today.month - 1 + offset
+        months.add((index // 12, index % 12 + 1))
+
+    op.execute('ALTER TABLE activity RENAME TO activity_legacy')
+    op.execute('ALTER TABLE activity_legacy '
+               'RENAME CONSTRAINT activity_pkey TO activity_legacy_pkey')
+    op.execute('UPDATE activity_legacy SET created = now() '
+               'WHERE created IS NULL')
+    op.execute("""
+        CREATE TABLE activity (
+            id INTEGER NOT NULL DEFAULT nextval('activity_id_seq'),
+            created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            user_id INTEGER REFERENCES "user" (id),
+            project_response_id INTEGER REFERENCES project_response (id),
+            project_id INTEGER REFERENCES project (id),
+            education_id INTEGER REFERENCES education (id),
+            work_experience_id INTEGER REFERENCES work_experience (id),
+            customer_id INTEGER REFERENCES customer (id),
+            action VARCHAR(150),
+            origin VARCHAR(100),
+            target VARCHAR(100),
+            PRIMARY KEY (id, created)
+        ) PARTITION BY RANGE (created)""")
+    op.execute('CREATE INDEX ix_activity_user_id_created '
+               'ON activity (user_id, created)')
+    op.execute('CREATE INDEX ix_activity_project_id_created '
+               'ON activity (project_id, created)')
+    op.execute('CREATE TABLE activity_default PARTITION OF activity DEFAULT')
+
+    months |= set((start.year, start.month) for start, in bind.execute(
+        sa.text("SELECT DISTINCT date_trunc('month', created) "
+                "FROM activity_legacy")))
+    for year, month in sorted(months):
+        create_month(year, month)
+
+    op.execute('INSERT INTO activity ({0}) SELECT {0} FROM activity_legacy'
+               .format(COLUMNS))
+    op.execute('ALTER SEQUENCE activity_id_seq OWNED BY activity.id')
+    op.execute('DROP TABLE activity_legacy')
+
+
+def downgrade():
+    op.execute('ALTER TABLE activity RENAME TO activity_partitioned')
+    op.execute("""
+        CREATE TABLE activity (
+            id INTEGER NOT NULL DEFAULT nextval('activity_id_seq')
+                PRIMARY KEY,
+            created TIMESTAMP WITHOUT TIME ZONE,
+            user_id INTEGER REFERENCES "user" (id),
+            project_response_id INTEGER REFERENCES project_response (id),
+            project_id INTEGER REFERENCES project (id),
+            education_id INTEGER REFERENCES education (id),
+            work_experience_id INTEGER REFERENCES work_experience (id),
+            customer_id INTEGER REFERENCES customer (id),
+            action VARCHAR(150),
+            origin VARCHAR(100),
+            target VARCHAR(100)
+        )""")
+    op.execute('INSERT INTO activity ({0}) SELECT {0} '
+               'FROM activity_partitioned'.format(COLUMNS))
+    op.execute('ALTER SEQUENCE activity_id_seq OWNED BY activity.id')
+    op.execute('DROP TABLE activity_partitioned CASCADE')
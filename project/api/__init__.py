@@ -11,6 +11,8 @@ from .endpoints.customer import bp_customer
 from .endpoints.project_response import bp_project_response
 from .endpoints.contact_person import bp_contact_person
 from .endpoints.activity import bp_activity
+from .endpoints.search import bp_search
+from .common import instrumentation # noqa
 from .. import app
 
 
@@ -59,3 +61,7 @@ def register_blueprints():
         bp_activity,
         url_prefix='{}/{}'.format(
             app.config['APPLICATION_ROOT'], 'activity'))
+    app.register_blueprint(
+        bp_search,
+        url_prefix='{}/{}'.format(
+            app.config['APPLICATION_ROOT'], 'search'))
@@ -4,6 +4,22 @@ from project.api.models import User
 from .utils import make_response
 
 
+def authenticate(auth_token):
+    """
+    Decodes the token onto g
+    :return: an error response, or None when the token is valid
+    """
+    resp = User.decode_auth_token(auth_token)
+    if isinstance(resp, str):
+        return make_response(
+            status_code=401,
+            status='failure',
+            message=resp)
+    g.user_id = resp['sub']
+    g.admin = resp['admin']
+    return None
+
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -20,15 +36,31 @@ def login_required(f):
                 status_code=401,
                 status='failure',
                 message='Bearer token malformed')
-        if auth_token:
-            resp = User.decode_auth_token(auth_token)
-            if isinstance(resp, str):
-                return make_response(
-                    status_code=401,
-                    status='failure',
-                    message=resp)
-        g.user_id = resp['sub']
-        g.admin = resp['admin']
+        error = authenticate(auth_token)
+        if error is not None:
+            return error
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def stream_login_required(f):
+    """
+    Like login_required, but also takes the token from the access_token
+    query parameter. Browsers' EventSource cannot set request headers.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.headers.get('Authorization'):
+            return login_required(f)(*args, **kwargs)
+        auth_token = request.args.get('access_token')
+        if not auth_token:
+            return make_response(
+                status_code=401,
+                status='failure',
+                message='Missing authorization header or access_token')
+        error = authenticate(auth_token)
+        if error is not None:
+            return error
         return f(*args, **kwargs)
     return decorated_function
 
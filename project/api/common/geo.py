@@ -0,0 +1,132 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from project import db
+from ..models import Location, Project, Customer, User
+from .indexes import CachedIndex
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    """
+    Great-circle distance in kilometres from one point to each of the given
+    points. Coordinates are in degrees and may be NumPy arrays; missing
+    coordinates given as NaN give NaN distances.
+    :return: ndarray
+    """
+    # Location coordinates come back from the database as Decimal
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(value, dtype=float))
+        for value in (latitude, longitude, latitudes, longitudes))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def unit_vectors(latitudes, longitudes):
+    """
+    Points on the unit sphere for the given coordinates in degrees. Straight
+    line distance between them grows with great-circle distance, which is
+    what lets a k-d tree answer queries on the sphere.
+    :return: ndarray of shape (n, 3)
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack((
+        np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def chord(distance_km):
+    """
+    Straight line distance on the unit sphere spanning a great-circle
+    distance
+    """
+    angle = min(distance_km / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+class SpatialIndex(CachedIndex):
+    """
+    A k-d tree over the locations of every row of model that has one.
+    Candidates come from the tree and are then measured and ordered by
+    haversine distance.
+    """
+    refresh_setting = 'LOCATION_INDEX_REFRESH_SECONDS'
+
+    def __init__(self, model):
+        super(SpatialIndex, self).__init__()
+        self.model = model
+
+    def build(self):
+        rows = db.session.query(
+            self.model.id, self.model._descriptive, Location.latitude,
+            Location.longitude).join(
+                Location, self.model.location_id == Location.id).filter(
+                    Location.latitude.isnot(None),
+                    Location.longitude.isnot(None)).all()
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        labels = [row[1] for row in rows]
+        latitudes = np.array([row[2] for row in rows], dtype=float)
+        longitudes = np.array([row[3] for row in rows], dtype=float)
+        tree = cKDTree(unit_vectors(latitudes, longitudes)) if rows else None
+        return ids, labels, latitudes, longitudes, tree
+
+    def _results(self, data, latitude, longitude, rows, limit=None):
+        ids, labels, latitudes, longitudes, tree = data
+        distances = haversine(
+            latitude, longitude, latitudes[rows], longitudes[rows])
+        order = np.argsort(distances, kind='mergesort')[:limit]
+        return [{
+            '_id': int(ids[rows[index]]),
+            '_descriptive': labels[rows[index]],
+            'distance_km': float(distances[index])
+        } for index in order]
+
+    def within(self, latitude, longitude, radius_km, limit):
+        """
+        The nearest limit rows located within radius_km of a point, nearest
+        first
+        :return: list
+        """
+        data = self.get()
+        tree = data[-1]
+        if tree is None:
+            return []
+        point = unit_vectors([latitude], [longitude])[0]
+        rows = np.array(
+            tree.query_ball_point(point, chord(radius_km)), dtype=np.int64)
+        return self._results(data, latitude, longitude, rows, limit)
+
+    def nearest(self, latitude, longitude, k):
+        """
+        The k rows located nearest to a point, nearest first
+        :return: list
+        """
+        data = self.get()
+        tree = data[-1]
+        if tree is None:
+            return []
+        point = unit_vectors([latitude], [longitude])[0]
+        rows = np.atleast_1d(tree.query(point, min(k, tree.n))[1])
+        return self._results(data, latitude, longitude, rows)
+
+
+nearby_projects = SpatialIndex(Project)
+nearby_customers = SpatialIndex(Customer)
+nearby_users = SpatialIndex(User)
+
+# Indexes defined elsewhere that are also built from locations
+location_dependents = []
+
+
+def locations_changed():
+    """
+    Invalidates the spatial indexes. Called after committing a change to a
+    location or to which location a row points at.
+    """
+    nearby_projects.invalidate()
+    nearby_customers.invalidate()
+    nearby_users.invalidate()
+    for index in location_dependents:
+        index.invalidate()
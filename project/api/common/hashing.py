@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from project import app, bcrypt
+
+
+class HashingUnavailable(Exception):
+    """Raised when the password hashing pool is saturated or too slow."""
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    # bcrypt releases the GIL while hashing, so plain threads are enough to
+    # keep the work off the request threads.
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                size = app.config.get('BCRYPT_POOL_SIZE')
+                depth = app.config.get('BCRYPT_QUEUE_DEPTH')
+                _slots = threading.BoundedSemaphore(size + depth)
+                _executor = ThreadPoolExecutor(max_workers=size)
+    return _executor, _slots
+
+
+def submit(fn, *args):
+    """
+    Queues fn on the hashing pool without waiting for it
+    :return: Future
+    """
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingUnavailable('Password hashing queue is full')
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda f: slots.release())
+    return future
+
+
+def run(fn, *args):
+    """
+    Runs fn on the hashing pool and waits at most BCRYPT_TIMEOUT_SECONDS
+    for the result
+    """
+    future = submit(fn, *args)
+    try:
+        return future.result(timeout=app.config.get('BCRYPT_TIMEOUT_SECONDS'))
+    except TimeoutError:
+        future.cancel()
+        raise HashingUnavailable('Password hashing timed out')
+
+
+def generate_password_hash(password, rounds=None):
+    if rounds is None:
+        rounds = app.config.get('BCRYPT_LOG_ROUNDS')
+    return run(bcrypt.generate_password_hash, password, rounds).decode()
+
+
+def check_password_hash(pw_hash, password):
+    return run(bcrypt.check_password_hash, pw_hash, password)
+
+
+def hash_rounds(pw_hash):
+    """
+    Returns the cost factor stored in a bcrypt hash, e.g. 12 for $2b$12$...
+    :return: integer|None
+    """
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(pw_hash):
+    return hash_rounds(pw_hash) != app.config.get('BCRYPT_LOG_ROUNDS')
@@ -0,0 +1,215 @@
+import re
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from operator import itemgetter
+
+from sqlalchemy import func, union
+
+from project import app, db
+from ..models import Tag, Education, WorkExperience, ProjectResponse
+from ..models.enums import ResponseType
+
+
+def normalize(title):
+    return ' '.join((title or '').lower().split())
+
+
+class CachedIndex(object):
+    """
+    An in-process index built from the database. It is rebuilt after
+    invalidate() or once it is older than the number of seconds in the
+    refresh_setting config key, which is what lets writes made through
+    another worker process show up. Only the first build blocks; after
+    that readers keep getting the previous snapshot while a background
+    thread rebuilds it.
+    """
+    refresh_setting = None
+
+    def __init__(self):
+        self._data = None
+        self._built = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def build(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self._generation += 1
+        self._built = None
+
+    def _fresh(self):
+        built = self._built
+        interval = app.config.get(self.refresh_setting, 0)
+        return built is not None and time.monotonic() - built < interval
+
+    def _rebuild(self):
+        generation = self._generation
+        data = self.build()
+        self._data = data
+        # An invalidation that arrived while building may not be
+        # reflected in data, so leave it marked stale.
+        if generation == self._generation:
+            self._built = time.monotonic()
+        return data
+
+    def _rebuild_in_background(self):
+        try:
+            with app.app_context():
+                try:
+                    self._rebuild()
+                finally:
+                    db.session.remove()
+        except Exception:
+            app.logger.exception('Rebuilding %s failed', type(self).__name__)
+        finally:
+            self._lock.release()
+
+    def get(self):
+        data = self._data
+        if self._fresh():
+            return data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    return self._rebuild()
+                return self._data
+        # Someone else is already rebuilding, keep serving the snapshot
+        if self._lock.acquire(blocking=False):
+            thread = threading.Thread(target=self._rebuild_in_background)
+            thread.daemon = True
+            try:
+                thread.start()
+            except Exception:
+                self._lock.release()
+                raise
+        return data
+
+
+class TagSuggestions(CachedIndex):
+    """
+    Tag titles with their usage counts, sorted by normalized title so a
+    prefix maps to a contiguous slice.
+    """
+    refresh_setting = 'TAG_INDEX_REFRESH_SECONDS'
+
+    def build(self):
+        counts = {}
+        spellings = {}
+        rows = db.session.query(Tag.title, func.count(Tag.id)).group_by(
+            Tag.title).all()
+        for title, count in rows:
+            key = normalize(title)
+            if not key:
+                continue
+            counts[key] = counts.get(key, 0) + count
+            # Show the most used spelling of a title
+            if count > spellings.get(key, (None, 0))[1]:
+                spellings[key] = (title, count)
+
+        keys = sorted(counts)
+        entries = [{'title': spellings[key][0], 'count': counts[key]}
+                   for key in keys]
+        ranked = sorted(entries, key=itemgetter('count'), reverse=True)
+        return keys, entries, ranked
+
+    def suggest(self, prefix, limit):
+        """
+        Returns the limit most used tags whose title starts with prefix
+        :return: list
+        """
+        keys, entries, ranked = self.get()
+        prefix = normalize(prefix)
+        if not prefix:
+            return ranked[:limit]
+        low = bisect_left(keys, prefix)
+        high = bisect_left(keys, prefix + '\uffff', low)
+        return heapq.nlargest(
+            limit, entries[low:high], key=itemgetter('count'))
+
+
+class SkillIndex(CachedIndex):
+    """
+    Inverted index from normalized tag title to the ids of the users it
+    applies to, through their own tags, their educations, their work
+    experience and the projects they have been accepted to.
+    """
+    refresh_setting = 'TAG_INDEX_REFRESH_SECONDS'
+
+    def build(self):
+        query = union(
+            db.session.query(Tag.title, Tag.user_id).filter(
+                Tag.user_id.isnot(None)),
+            db.session.query(Tag.title, Education.user_id).join(
+                Education, Tag.education_id == Education.id),
+            db.session.query(Tag.title, WorkExperience.user_id).join(
+                WorkExperience, Tag.work_experience_id == WorkExperience.id),
+            db.session.query(Tag.title, ProjectResponse.user_id).join(
+                ProjectResponse,
+                Tag.project_id == ProjectResponse.project_id).filter(
+                    ProjectResponse.type == ResponseType.accepted.value))
+
+        postings = defaultdict(set)
+        for title, user_id in db.session.execute(query):
+            key = normalize(title)
+            if key and user_id is not None:
+                postings[key].add(user_id)
+        return dict((key, frozenset(ids)) for key, ids in postings.items())
+
+    def search(self, clauses):
+        """
+        Returns the ids of the users matching any of clauses, where a clause
+        is a list of terms that all have to match. Posting lists are
+        intersected smallest first so a rare term cuts the work short.
+        :return: set
+        """
+        postings = self.get()
+        result = set()
+        for terms in clauses:
+            lists = sorted(
+                (postings.get(term, frozenset()) for term in terms), key=len)
+            matches = set(lists[0])
+            for posting in lists[1:]:
+                if not matches:
+                    break
+                matches &= posting
+            result |= matches
+        return result
+
+
+def parse_query(q):
+    """
+    Parses a query such as 'python AND kubernetes OR go' into clauses of
+    normalized terms. AND binds tighter than OR, so that example matches
+    users with both python and kubernetes, or with go.
+    :return: list of lists
+    """
+    clauses = []
+    for clause in re.split(r'\s*\bOR\b\s*', q or ''):
+        terms = [normalize(term)
+                 for term in re.split(r'\s*\bAND\b\s*', clause)]
+        if any(terms) and all(terms):
+            clauses.append(terms)
+        elif any(terms):
+            raise ValueError('Empty term in {!r}'.format(clause.strip()))
+    return clauses
+
+
+tag_suggestions = TagSuggestions()
+user_skills = SkillIndex()
+# Indexes defined elsewhere that are also built from tags
+tag_dependents = []
+
+
+def tags_changed():
+    """
+    Invalidates every index built from tags. Called by the tag write paths
+    after committing.
+    """
+    tag_suggestions.invalidate()
+    user_skills.invalidate()
+    for index in tag_dependents:
+        index.invalidate()
@@ -0,0 +1,55 @@
+import re
+import time
+from collections import Counter
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+from ... import app, db
+
+_parameter = re.compile(r'%\(\w+\)s')
+_parameter_list = re.compile(r'\?(, \?)+')
+
+
+def statement_shape(statement):
+    """
+    Reduces a statement to its shape, so that queries differing only in
+    their parameters or in the length of an IN list compare equal
+    """
+    return _parameter_list.sub('?', _parameter.sub('?', statement))
+
+
+@event.listens_for(db.engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(db.engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    if not has_request_context():
+        return
+    if 'sql_statements' not in g:
+        g.sql_statements = Counter()
+        g.sql_time = 0.0
+    g.sql_statements[statement_shape(statement)] += 1
+    g.sql_time += elapsed
+
+
+@app.after_request
+def report_queries(response):
+    statements = g.get('sql_statements', Counter())
+    threshold = app.config.get('SQL_REPEAT_WARNING_THRESHOLD')
+    for statement, count in statements.items():
+        if count > threshold:
+            app.logger.warning(
+                '%s ran the same statement %d times, possible N+1:\n%s',
+                request.path, count, statement)
+
+    if app.debug:
+        response.headers['X-Query-Count'] = str(sum(statements.values()))
+        response.headers['X-Query-Time'] = '{:.1f}ms'.format(
+            g.get('sql_time', 0.0) * 1000)
+    return response
@@ -0,0 +1,157 @@
+import datetime
+from collections import namedtuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import literal
+
+from project import app, db
+from ..models import (
+    User, Location, Tag, Education, WorkExperience, Project, ProjectResponse)
+from ..models.enums import ResponseType
+from .geo import haversine, location_dependents
+from .indexes import CachedIndex, normalize, tag_dependents
+
+Candidates = namedtuple('Candidates', [
+    'user_ids', 'labels', 'latitudes', 'longitudes', 'terms', 'skills',
+    'booked_rows', 'booked_projects', 'booked_start', 'booked_end'])
+
+
+def _datetimes(values, missing):
+    return np.array(
+        [value or missing for value in values], dtype='datetime64[s]')
+
+
+class CandidateIndex(CachedIndex):
+    """
+    Everything needed to score users against a project, held as arrays so a
+    ranking is a handful of vector operations. skills is a sparse user x
+    term matrix where an entry is 1, or MATCHING_HIGHLIGHT_WEIGHT when the
+    tag comes from a highlighted education or work experience.
+    """
+    refresh_setting = 'MATCHING_REFRESH_SECONDS'
+
+    def build(self):
+        users = db.session.query(
+            User.id, User._descriptive, Location.latitude,
+            Location.longitude).outerjoin(
+                Location, User.location_id == Location.id).order_by(
+                    User.id).all()
+        rows = dict((user[0], row) for row, user in enumerate(users))
+
+        highlight = app.config.get('MATCHING_HIGHLIGHT_WEIGHT')
+        terms = {}
+        weights = {}
+        sources = (
+            db.session.query(Tag.title, Tag.user_id, literal(False)).filter(
+                Tag.user_id.isnot(None)),
+            db.session.query(
+                Tag.title, Education.user_id, Education.highlight).join(
+                    Education, Tag.education_id == Education.id),
+            db.session.query(
+                Tag.title, WorkExperience.user_id,
+                WorkExperience.highlight).join(
+                    WorkExperience,
+                    Tag.work_experience_id == WorkExperience.id))
+        for source in sources:
+            for title, user_id, highlighted in source:
+                term = normalize(title)
+                row = rows.get(user_id)
+                if not term or row is None:
+                    continue
+                key = (row, terms.setdefault(term, len(terms)))
+                weight = highlight if highlighted else 1.0
+                weights[key] = max(weights.get(key, 0), weight)
+        skills = sparse.csr_matrix(
+            (list(weights.values()),
+             ([key[0] for key in weights], [key[1] for key in weights])),
+            shape=(len(users), len(terms)))
+
+        bookings = [
+            booking for booking in db.session.query(
+                ProjectResponse.user_id, Project.id, Project.startdate,
+                Project.enddate).join(
+                    Project, ProjectResponse.project_id == Project.id).filter(
+                        ProjectResponse.type == ResponseType.accepted.value)
+            if booking[0] in rows]
+
+        return Candidates(
+            user_ids=np.array([user[0] for user in users], dtype=np.int64),
+            labels=[user[1] for user in users],
+            latitudes=np.array(
+                [user[2] for user in users], dtype=float),
+            longitudes=np.array(
+                [user[3] for user in users], dtype=float),
+            terms=terms,
+            skills=skills,
+            booked_rows=np.array(
+                [rows[booking[0]] for booking in bookings], dtype=np.int64),
+            booked_projects=np.array(
+                [booking[1] for booking in bookings], dtype=np.int64),
+            booked_start=_datetimes(
+                [booking[2] for booking in bookings], datetime.datetime.min),
+            booked_end=_datetimes(
+                [booking[3] for booking in bookings], datetime.datetime.max))
+
+    def rank(self, project, limit):
+        """
+        Scores every user against project and returns the best limit of
+        them. The score mixes the share of the project's tags a user has
+        with how close they live to the project location. Users accepted to
+        another project overlapping its dates are left out.
+        :return: list
+        """
+        data = self.get()
+        count = len(data.user_ids)
+        if not count:
+            return []
+
+        terms = set(normalize(tag.title) for tag in project.tags)
+        terms.discard('')
+        wanted = np.zeros(len(data.terms))
+        wanted[[data.terms[term] for term in terms if term in data.terms]] = 1
+        tag_score = data.skills.dot(wanted) / max(
+            len(terms) * app.config.get('MATCHING_HIGHLIGHT_WEIGHT'), 1)
+
+        location = project.location
+        if location is not None and location.latitude is not None and \
+                location.longitude is not None:
+            distance = haversine(
+                location.latitude, location.longitude,
+                data.latitudes, data.longitudes)
+        else:
+            distance = np.full(count, np.nan)
+        distance_score = np.nan_to_num(np.exp(
+            -distance / app.config.get('MATCHING_DISTANCE_SCALE_KM')))
+
+        score = app.config.get('MATCHING_TAG_WEIGHT') * tag_score + \
+            app.config.get('MATCHING_DISTANCE_WEIGHT') * distance_score
+
+        available = np.ones(count, dtype=bool)
+        start = np.datetime64(
+            project.startdate or datetime.datetime.min, 's')
+        end = np.datetime64(project.enddate or datetime.datetime.max, 's')
+        clashes = (data.booked_start < end) & (data.booked_end > start) & \
+            (data.booked_projects != project.id)
+        available[data.booked_rows[clashes]] = False
+
+        rows = np.flatnonzero(available & (score > 0))
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-score[rows], limit - 1)[:limit]]
+        rows = rows[np.argsort(-score[rows], kind='mergesort')]
+
+        return [{
+            'user': {
+                '_id': int(data.user_ids[row]),
+                '_descriptive': data.labels[row]
+            },
+            'score': float(score[row]),
+            'tag_score': float(tag_score[row]),
+            'distance_km': None if np.isnan(distance[row])
+            else float(distance[row])
+        } for row in rows]
+
+
+candidates = CandidateIndex()
+tag_dependents.append(candidates)
+location_dependents.append(candidates)
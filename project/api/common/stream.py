@@ -0,0 +1,90 @@
+import select
+import threading
+import time
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from ... import app, db
+
+
+class Listener(object):
+    """
+    Listens on a Postgres NOTIFY channel with a single connection per
+    process and wakes up every stream waiting for news. Streams only learn
+    that something happened and query for what is new themselves.
+
+    on_notify, if given, is called from the listening thread with the
+    payloads of each batch of notifications, or with None after
+    (re)connecting when notifications may have been missed.
+    """
+
+    def __init__(self, channel, on_notify=None):
+        self.channel = channel
+        self.on_notify = on_notify
+        self.version = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._listen,
+                    name='listen-{}'.format(self.channel),
+                    daemon=True)
+                self._thread.start()
+
+    def wait(self, version, timeout):
+        """
+        Blocks until a notification newer than version arrives or timeout
+        seconds pass
+        :return: the current version
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.version != version, timeout)
+            return self.version
+
+    def _notify(self, payloads=None):
+        if self.on_notify is not None:
+            self.on_notify(payloads)
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def _listen(self):
+        while True:
+            connection = None
+            try:
+                # A dedicated connection: detached from the pool, so it is
+                # never reset and handed to a request while we listen on it
+                pooled = db.engine.raw_connection()
+                pooled.detach()
+                connection = pooled.connection
+                connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                connection.cursor().execute('LISTEN {}'.format(self.channel))
+                # Anything may have happened while we were not listening
+                self._notify()
+                while True:
+                    if select.select([connection], [], [], 60)[0]:
+                        connection.poll()
+                        if connection.notifies:
+                            payloads = [notify.payload
+                                        for notify in connection.notifies]
+                            del connection.notifies[:]
+                            self._notify(payloads)
+            except Exception:
+                app.logger.exception(
+                    'Lost LISTEN connection for %s, reconnecting',
+                    self.channel)
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                time.sleep(1)
+
+
+def sse_event(event_id, event, data):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event_id, event, data)
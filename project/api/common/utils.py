@@ -1,45 +1,262 @@
-from flask import jsonify
-from sqlalchemy import and_
+import threading
+from collections import OrderedDict
+
+from flask import (
+    json, jsonify, request, url_for, Response, stream_with_context)
+from sqlalchemy import inspect, case
+from sqlalchemy.orm import load_only, noload, joinedload, selectinload
+from webargs import fields
+from webargs.flaskparser import parser
+from ... import app
 from ..models import Tag
+from .indexes import tags_changed
+
+
+page_args = {
+    'limit': fields.Integer(validate=lambda limit: limit > 0),
+    'after': fields.Integer()
+}
+
+stream_args = {
+    'stream': fields.Boolean(missing=False)
+}
+
+sparse_args = {
+    'fields': fields.DelimitedList(fields.String())
+}
 
+# Least recently used restricted schemas, bounded because clients choose
+# the field sets
+_sparse_schemas = OrderedDict()
+_sparse_schemas_lock = threading.Lock()
 
-def make_response(status_code, status, message=None, data=None):
-    response_content = dict(message=message, data=data, status=status)
+
+def make_response(status_code, status, message=None, data=None, links=None):
+    response_content = dict(
+        message=message, data=data, status=status, links=links)
     response = jsonify(
         {k: v for k, v in response_content.items() if v is not None})
     response.status_code = status_code
     return response
 
 
-def set_tags(session, parent, args, relation):
-    existing_ids = [tag.id for tag in Tag.query.filter(
-        getattr(Tag, relation).__eq__(parent.id)).all()]
-
-    request_ids = [tag.get(
-        'id', None) for tag in args['tags'] if tag.get('id', None)]
-
-    delete_ids = list(set(existing_ids) - set(request_ids))
-    print(args)
-    for t in args['tags']:
-        print(t)
-        if not t.get('id', None):
-            t[relation] = id
-            print("!!!!!!!!!!")
-            parent.tags.append(Tag(**t))
+def requested_fields(schema):
+    """
+    Translates the `fields` query parameter, given in output names such as
+    `_id`, into the names of the schema fields to serialize.
+    :return: tuple|None
+    """
+    args = parser.parse(sparse_args, request, locations=('query',))
+    if not args.get('fields'):
+        return None
+    names = {}
+    for name, field in schema.fields.items():
+        names[field.dump_to or name] = name
+    only = tuple(sorted(
+        set(names[key] for key in args['fields'] if key in names)))
+    return only or None
+
+
+def sparse_schema(schema):
+    """
+    Returns a schema restricted to the requested fields. Restricted schemas
+    are reused for the SPARSE_SCHEMA_CACHE_SIZE most recent field sets.
+    """
+    only = requested_fields(schema)
+    if only is None:
+        return schema
+    key = (type(schema), schema.many, only)
+    with _sparse_schemas_lock:
+        restricted = _sparse_schemas.get(key)
+        if restricted is not None:
+            _sparse_schemas.move_to_end(key)
+            return restricted
+    restricted = type(schema)(many=schema.many, only=only)
+    with _sparse_schemas_lock:
+        _sparse_schemas[key] = restricted
+        while len(_sparse_schemas) > app.config.get(
+                'SPARSE_SCHEMA_CACHE_SIZE'):
+            _sparse_schemas.popitem(last=False)
+    return restricted
+
+
+def sparse_query(query, schema):
+    """
+    Limits the loaded columns to the ones backing the requested fields and
+    stops relationships that are not requested from being loaded. Fields
+    that are not plain columns or relationships, like computed properties,
+    may use anything on the row, so then the query is left as it is.
+    """
+    only = requested_fields(schema)
+    if only is None:
+        return query
+    mapper = inspect(query.column_descriptions[0]['entity'])
+
+    columns = set(column.key for column in mapper.primary_key)
+    relationships = set()
+    for name in only:
+        attribute = schema.fields[name].attribute or name
+        if attribute in mapper.column_attrs:
+            columns.add(attribute)
+        elif attribute in mapper.relationships:
+            relationships.add(attribute)
+            for column in mapper.relationships[attribute].local_columns:
+                columns.add(mapper.get_property_by_column(column).key)
+        else:
+            return query
+
+    options = [noload(relationship.key)
+               for relationship in mapper.relationships
+               if relationship.key not in relationships]
+    options.append(load_only(*columns))
+    return query.options(*options)
+
+
+def eager_query(query, schema):
+    """
+    Adds loader options for the relationship paths the schema declares in
+    `eager_load`, for the fields it will actually serialize. Collections
+    are loaded with one SELECT ... IN per path and many-to-one relations
+    are joined, so a page costs a fixed number of queries.
+    """
+    mapper = inspect(query.column_descriptions[0]['entity'])
+    used = set(field.attribute or name
+               for name, field in schema.fields.items())
+
+    options = []
+    for path in getattr(schema, 'eager_load', ()):
+        keys = path.split('.')
+        if keys[0] not in used:
             continue
-        filter_group = [
-            getattr(Tag, relation).__eq__(parent.id),
-            getattr(Tag, 'id').__eq__(t['id'])]
-        tag = Tag.query.filter(and_(*filter_group)).first()
-        print(filter_group)
-        print(tag)
-        if not tag:
-            return False
-        tag.title = t['title']
-
-    for tag_id in delete_ids:
-        tag = Tag.query.get(tag_id)
-        session.delete(tag)
+        option = None
+        current = mapper
+        for key in keys:
+            if key not in current.relationships:
+                break
+            relationship = current.relationships[key]
+            loader = selectinload if relationship.uselist else joinedload
+            option = loader(key) if option is None else \
+                getattr(option, loader.__name__)(key)
+            current = relationship.mapper
+        if option is not None:
+            options.append(option)
+    return query.options(*options)
+
+
+def paginate(query, reverse=False):
+    """
+    Applies keyset pagination on the id of the queried model. Clients pass
+    `limit` and the last id they have seen as `after`, so every page is an
+    index range scan no matter how deep it is.
+    :return: (items, links)
+    """
+    args = parser.parse(page_args, request, locations=('query',))
+    limit = min(
+        args.get('limit') or app.config.get('PAGINATION_DEFAULT_LIMIT'),
+        app.config.get('PAGINATION_MAX_LIMIT'))
+    key = query.column_descriptions[0]['entity'].id
+
+    if args.get('after') is not None:
+        query = query.filter(
+            key < args['after'] if reverse else key > args['after'])
+    items = query.order_by(
+        key.desc() if reverse else key).limit(limit + 1).all()
+
+    links = {'self': request.url}
+    if len(items) > limit:
+        items = items[:limit]
+        params = dict(request.view_args, **request.args.to_dict())
+        params.update(limit=limit, after=items[-1].id)
+        links['next'] = url_for(request.endpoint, _external=True, **params)
+    return items, links
+
+
+def stream_response(query, schema, reverse=False):
+    """
+    Streams every row of the query, starting after the `after` cursor, as
+    the usual {"status": .., "data": [..]} envelope. Rows are fetched and
+    serialized in keyset chunks, so memory use does not grow with the
+    number of rows and eager loading applies to every chunk.
+    """
+    args = parser.parse(page_args, request, locations=('query',))
+    chunk_size = app.config.get('STREAM_CHUNK_SIZE')
+    key = query.column_descriptions[0]['entity'].id
+
+    def fetch_chunk(after):
+        chunk = query
+        if after is not None:
+            chunk = chunk.filter(key < after if reverse else key > after)
+        return chunk.order_by(
+            key.desc() if reverse else key).limit(chunk_size).all()
+
+    def generate():
+        yield '{"status": "success", "data": ['
+        after = args.get('after')
+        first = True
+        while True:
+            chunk = fetch_chunk(after)
+            if not chunk:
+                break
+            data = json.dumps(schema.dump(chunk).data)[1:-1]
+            yield data if first else ',' + data
+            first = False
+            after = chunk[-1].id
+        yield ']}'
+
+    return Response(
+        stream_with_context(generate()), mimetype='application/json')
+
+
+def make_list_response(query, schema, reverse=False):
+    query = sparse_query(query, schema)
+    schema = sparse_schema(schema)
+    query = eager_query(query, schema)
+    if parser.parse(stream_args, request, locations=('query',))['stream']:
+        return stream_response(query, schema, reverse=reverse)
+    items, links = paginate(query, reverse=reverse)
+    return make_response(
+        status_code=200,
+        status='success',
+        data=schema.dump(items).data,
+        links=links)
+
+
+def set_tags(session, parent, args, relation):
+    """
+    Replaces the tags of parent with the submitted ones. The diff is computed
+    against a single fetch of the existing tags; new tags are inserted,
+    renamed tags updated and dropped tags deleted in one statement each.
+    :return: False if parent is missing or a submitted id is not one of its
+    tags
+    """
+    if parent is None:
+        return False
+
+    existing = dict(session.query(Tag.id, Tag.title).filter(
+        getattr(Tag, relation) == parent.id))
+    submitted = args.get('tags', [])
+    request_ids = set(tag['id'] for tag in submitted if tag.get('id'))
+    if not request_ids.issubset(existing):
+        return False
+
+    inserts = [{relation: parent.id, 'title': tag['title']}
+               for tag in submitted if not tag.get('id')]
+    renames = dict((tag['id'], tag['title']) for tag in submitted
+                   if tag.get('id') and existing[tag['id']] != tag['title'])
+    delete_ids = set(existing) - request_ids
+
+    table = Tag.__table__
+    # Lists of parameters would go out as executemany, one statement per
+    # row, so build single multi-row statements instead
+    if inserts:
+        session.execute(table.insert().values(inserts))
+    if renames:
+        session.execute(table.update().where(
+            table.c.id.in_(list(renames))).values(
+                title=case(renames, value=table.c.id)))
+    if delete_ids:
+        session.execute(table.delete().where(table.c.id.in_(delete_ids)))
 
     session.commit()
+    tags_changed()
     return True
@@ -1,18 +1,24 @@
-from flask import Blueprint
+from flask import (
+    Blueprint, Response, json, request, stream_with_context)
+from sqlalchemy import func
 from webargs import fields
 from webargs.flaskparser import use_args
 
-from project import db
+from project import app, db
 from project.api.models import Activity, Customer, Project
 from project.api.schemas import ActivitySchema, CustomerSchema, ProjectSchema
-from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.decorators import (
+    login_required, stream_login_required)
+from project.api.common.stream import Listener, sse_event
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_activity = Blueprint('activity', __name__)
 
 activity_schema = ActivitySchema()
 activitys_schema = ActivitySchema(many=True)
+activity_listener = Listener(Activity.channel)
 
 args = {
     'id': fields.Integer(required=True, activity='view_args')
@@ -22,7 +28,8 @@ args = {
 @login_required
 @use_args(args)
 def get_activity_detail(args, id):
-    activity = Activity.query.get(id)
+    activity = sparse_query(Activity.query, activity_schema).filter_by(
+        id=id).first()
     if not activity:
         return make_response(
             status_code=404,
@@ -32,14 +39,61 @@ def get_activity_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=activity_schema.dump(activity).data)
+        data=sparse_schema(activity_schema).dump(activity).data)
 
 
 @bp_activity.route('/', methods=['GET'])
 @login_required
 def fetch_activity_list():
-    activitys = Activity.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=activitys_schema.dump(activitys).data)
+    return make_list_response(Activity.query, activitys_schema)
+
+
+@bp_activity.route('/stream', methods=['GET'])
+@stream_login_required
+def stream_activity_list():
+    """
+    Pushes activities as Server-Sent Events as soon as they are committed.
+    Reconnecting clients send the id of the last event they received in
+    Last-Event-ID and get everything after it first. Browser clients using
+    EventSource, which cannot send an Authorization header, pass the token
+    as ?access_token= instead.
+    """
+    activity_listener.start()
+    last_event_id = request.headers.get(
+        'Last-Event-ID', request.args.get('last_event_id'))
+    if last_event_id is not None and not last_event_id.isdigit():
+        return make_response(
+            status_code=400,
+            status='failure',
+            message='Last-Event-ID must be an activity id')
+    chunk_size = app.config.get('STREAM_CHUNK_SIZE')
+    keepalive = app.config.get('SSE_KEEPALIVE_SECONDS')
+
+    def generate():
+        if last_event_id is None:
+            last_id = db.session.query(func.max(Activity.id)).scalar() or 0
+        else:
+            last_id = int(last_event_id)
+        while True:
+            version = activity_listener.version
+            activities = Activity.query.filter(Activity.id > last_id).order_by(
+                Activity.id).limit(chunk_size).all()
+            events = [sse_event(activity.id, 'activity', json.dumps(
+                activity_schema.dump(activity).data))
+                for activity in activities]
+            if activities:
+                last_id = activities[-1].id
+            # End the transaction so the connection goes back to the pool
+            # while we wait
+            db.session.rollback()
+            for event in events:
+                yield event
+            if len(events) == chunk_size:
+                continue
+            if activity_listener.wait(version, keepalive) == version:
+                yield ': keepalive\n\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
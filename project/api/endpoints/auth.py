@@ -1,12 +1,14 @@
-from flask import Blueprint, request
+import datetime
+from flask import Blueprint, request, g
 from sqlalchemy import func
 from webargs import fields
 from webargs.flaskparser import use_args
 
-from project import db
+from project import app, db
 from project.api.models import (User, BlacklistToken)
 from project.api.schemas import UserSchema
 from project.api.common.decorators import login_required
+from project.api.common.hashing import HashingUnavailable
 from project.api.common.utils import make_response
 
 bp_auth = Blueprint('auth', __name__)
@@ -38,7 +40,13 @@ def register(args):
             status_code=409,
             status='failure',
             message='User already exists')
-    user = User(**args)
+    try:
+        user = User(**args)
+    except HashingUnavailable as e:
+        return make_response(
+            status_code=503,
+            status='failure',
+            message=str(e))
     db.session.add(user)
     db.session.commit()
 
@@ -59,14 +67,23 @@ def login(args):
             status_code=404,
             status='failure',
             message='Invalid password and/or username and account.')
-    if not user.check_password_hash(args['password']):
+    try:
+        valid_password = user.check_password_hash(args['password'])
+    except HashingUnavailable as e:
+        return make_response(
+            status_code=503,
+            status='failure',
+            message=str(e))
+    if not valid_password:
         return make_response(
             status_code=404,
             status='failure',
             message='Invalid password and/or username and account.')
+    user.schedule_rehash(args['password'])
 
     data = user_schema.dump(user).data
-    auth_token = user.encode_auth_token(days=10000)
+    auth_token = user.encode_auth_token(
+        days=app.config.get('AUTH_TOKEN_EXPIRATION_DAYS'))
     data['auth_token'] = auth_token
 
     return make_response(
@@ -92,10 +109,32 @@ def logout(args):
         return make_response(status_code=401, status='failure', message=resp)
 
     # Blacklist the token
-    blacklist_token = BlacklistToken(token=auth_token)
+    blacklist_token = BlacklistToken(
+        jti=resp['jti'],
+        expires=datetime.datetime.utcfromtimestamp(resp['exp']))
     db.session.add(blacklist_token)
+    blacklist_token.announce()
     db.session.commit()
+    BlacklistToken.add_to_cache(
+        blacklist_token.jti, blacklist_token.expires)
     return make_response(
         status_code=200,
         status='success',
         message='Successfully logged out.')
+
+
+@bp_auth.route('/logout/all', methods=['POST'])
+@login_required
+def logout_all():
+    user = User.query.get(g.user_id)
+    if not user:
+        return make_response(
+            status_code=404,
+            status='failure',
+            message='No user found with that id')
+
+    user.revoke_auth_tokens()
+    return make_response(
+        status_code=200,
+        status='success',
+        message='Successfully logged out from all sessions.')
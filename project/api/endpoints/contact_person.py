@@ -6,7 +6,8 @@ from project import db
 from project.api.models import ContactPerson, Customer
 from project.api.schemas import ContactPersonSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_contact_person = Blueprint('contact_person', __name__)
@@ -30,7 +31,8 @@ save_args = {
 @login_required
 @use_args(args)
 def get_contact_person_detail(args, id):
-    contact_person = ContactPerson.query.get(id)
+    contact_person = sparse_query(
+        ContactPerson.query, contact_person_schema).get(id)
     if not contact_person:
         return make_response(
             status_code=404,
@@ -40,17 +42,13 @@ def get_contact_person_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=contact_person_schema.dump(contact_person).data)
+        data=sparse_schema(contact_person_schema).dump(contact_person).data)
 
 
 @bp_contact_person.route('/', methods=['GET'])
 @login_required
 def fetch_contact_person_list():
-    contact_persons = ContactPerson.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=contact_persons_schema.dump(contact_persons).data)
+    return make_list_response(ContactPerson.query, contact_persons_schema)
 
 
 @bp_contact_person.route('/', methods=['POST'])
@@ -6,7 +6,9 @@ from project import db
 from project.api.models import Customer, Project, Location
 from project.api.schemas import CustomerSchema, ProjectSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.geo import locations_changed
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_customer = Blueprint('customer', __name__)
@@ -30,7 +32,7 @@ save_args = {
 @login_required
 @use_args(args)
 def get_customer_detail(args, id):
-    customer = Customer.query.get(id)
+    customer = sparse_query(Customer.query, customer_schema).get(id)
     if not customer:
         return make_response(
             status_code=404,
@@ -40,17 +42,13 @@ def get_customer_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=customer_schema.dump(customer).data)
+        data=sparse_schema(customer_schema).dump(customer).data)
 
 
 @bp_customer.route('/', methods=['GET'])
 @login_required
 def fetch_customer_list():
-    customers = Customer.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=customers_schema.dump(customers).data)
+    return make_list_response(Customer.query, customers_schema)
 
 
 @bp_customer.route('/', methods=['POST'])
@@ -72,6 +70,7 @@ def create_customer(args):
         location.customers.append(customer)
     db.session.add(customer)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -98,6 +97,7 @@ def update_customer(args, id):
     if location:
         location.customers.append(customer)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -117,6 +117,7 @@ def delete_customer(id):
 
     db.session.delete(customer)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -127,8 +128,5 @@ def delete_customer(id):
 @bp_customer.route('/<id>/project', methods=['GET'])
 @login_required
 def get_project_list(id):
-    projects = Project.query.filter_by(customer_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=ProjectSchema(many=True).dump(projects).data)
+    return make_list_response(
+        Project.query.filter_by(customer_id=id), ProjectSchema(many=True))
@@ -6,7 +6,8 @@ from project import db
 from project.api.models import Education, User, Tag
 from project.api.schemas import EducationSchema, TagSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response, set_tags
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema, set_tags)
 from project.api.models.enums import EducationType
 
 bp_education = Blueprint('education', __name__)
@@ -34,7 +35,7 @@ save_args = {
 @login_required
 @use_args(args)
 def get_education_detail(args, id):
-    education = Education.query.get(id)
+    education = sparse_query(Education.query, education_schema).get(id)
     if not education:
         return make_response(
             status_code=404,
@@ -44,17 +45,13 @@ def get_education_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=education_schema.dump(education).data)
+        data=sparse_schema(education_schema).dump(education).data)
 
 
 @bp_education.route('/', methods=['GET'])
 @login_required
 def get_education_list():
-    educations = Education.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=educations_schema.dump(educations).data)
+    return make_list_response(Education.query, educations_schema)
 
 
 @bp_education.route('/', methods=['POST'])
@@ -122,11 +119,8 @@ def delete_education(args, id):
 @bp_education.route('/<id>/tag', methods=['GET'])
 @login_required
 def get_tag_list(id):
-    tags = Tag.query.filter_by(education_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=TagSchema(many=True).dump(tags).data)
+    return make_list_response(
+        Tag.query.filter_by(education_id=id), TagSchema(many=True))
 
 
 tags_arg = {
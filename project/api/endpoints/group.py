@@ -6,7 +6,8 @@ from project import db
 from project.api.models import Group
 from project.api.schemas import GroupSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_group = Blueprint('group', __name__)
@@ -28,7 +29,7 @@ save_args = {
 @login_required
 @use_args(args)
 def get_group_detail(args, id):
-    group = Group.query.get(id)
+    group = sparse_query(Group.query, group_schema).get(id)
     if not group:
         return make_response(
             status_code=404,
@@ -38,17 +39,13 @@ def get_group_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=group_schema.dump(group).data)
+        data=sparse_schema(group_schema).dump(group).data)
 
 
 @bp_group.route('/', methods=['GET'])
 @login_required
 def fetch_group_list():
-    groups = Group.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=groups_schema.dump(groups).data)
+    return make_list_response(Group.query, groups_schema)
 
 
 @bp_group.route('/', methods=['POST'])
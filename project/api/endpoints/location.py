@@ -2,11 +2,14 @@ from flask import Blueprint
 from webargs import fields
 from webargs.flaskparser import use_args
 
-from project import db
+from project import app, db
 from project.api.models import Location, Customer, Project
 from project.api.schemas import LocationSchema, CustomerSchema, ProjectSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.geo import (
+    nearby_projects, nearby_customers, nearby_users, locations_changed)
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_location = Blueprint('location', __name__)
@@ -28,12 +31,22 @@ save_args = {
     'country': fields.String(50, required=True)
 }
 
+radius_args = {
+    'radius_km': fields.Float(
+        required=True, validate=lambda radius: radius > 0),
+    'limit': fields.Integer(validate=lambda limit: limit > 0)
+}
+
+nearest_args = {
+    'k': fields.Integer(validate=lambda k: k > 0)
+}
+
 
 @bp_location.route('/<id>', methods=['GET'])
 @login_required
 @use_args(args)
 def get_location_detail(args, id):
-    location = Location.query.get(id)
+    location = sparse_query(Location.query, location_schema).get(id)
     if not location:
         return make_response(
             status_code=404,
@@ -43,17 +56,13 @@ def get_location_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=location_schema.dump(location).data)
+        data=sparse_schema(location_schema).dump(location).data)
 
 
 @bp_location.route('/', methods=['GET'])
 @login_required
 def fetch_location_list():
-    locations = Location.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=locations_schema.dump(locations).data)
+    return make_list_response(Location.query, locations_schema)
 
 
 @bp_location.route('/', methods=['POST'])
@@ -64,6 +73,7 @@ def create_location(args):
 
     db.session.add(location)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -78,6 +88,7 @@ def update_location(args, id):
     location = Location.query.get(id)
     location.update(**args)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -98,6 +109,7 @@ def delete_location(args, id):
 
     db.session.delete(location)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -108,18 +120,77 @@ def delete_location(args, id):
 @bp_location.route('/<id>/customer', methods=['GET'])
 @login_required
 def get_customer_list(id):
-    customers = Customer.query.filter_by(location_id=id).all()
+    return make_list_response(
+        Customer.query.filter_by(location_id=id), CustomerSchema(many=True))
+
+
+@bp_location.route('/<id>/project', methods=['GET'])
+@login_required
+def get_project_list(id):
+    return make_list_response(
+        Project.query.filter_by(location_id=id), ProjectSchema(many=True))
+
+
+def located(id):
+    """
+    Returns the location with its coordinates, or None if it is missing or
+    has not been placed on the map
+    """
+    location = Location.query.get(id)
+    if location is None or location.latitude is None or \
+            location.longitude is None:
+        return None
+    return location
+
+
+def nearest_response(id, index, args):
+    location = located(id)
+    if not location:
+        return make_response(
+            status_code=404,
+            status='failure',
+            message='No location with coordinates found with that id')
+
+    k = min(
+        args.get('k') or app.config.get('LOCATION_NEAREST_DEFAULT'),
+        app.config.get('PAGINATION_MAX_LIMIT'))
     return make_response(
         status_code=200,
         status='success',
-        data=CustomerSchema(many=True).dump(customers).data)
+        data=index.nearest(location.latitude, location.longitude, k))
 
 
-@bp_location.route('/<id>/project', methods=['GET'])
+@bp_location.route('/<id>/project/nearby', methods=['GET'])
 @login_required
-def get_project_list(id):
-    projects = Project.query.filter_by(location_id=id).all()
+@use_args(radius_args)
+def get_nearby_projects(args, id):
+    location = located(id)
+    if not location:
+        return make_response(
+            status_code=404,
+            status='failure',
+            message='No location with coordinates found with that id')
+
+    limit = min(
+        args.get('limit') or app.config.get('PAGINATION_DEFAULT_LIMIT'),
+        app.config.get('PAGINATION_MAX_LIMIT'))
     return make_response(
         status_code=200,
         status='success',
-        data=ProjectSchema(many=True).dump(projects).data)
+        data=nearby_projects.within(
+            location.latitude, location.longitude, args['radius_km'],
+            limit))
+
+
+@bp_location.route('/<id>/customer/nearest', methods=['GET'])
+@login_required
+@use_args(nearest_args)
+def get_nearest_customers(args, id):
+    return nearest_response(id, nearby_customers, args)
+
+
+@bp_location.route('/<id>/user/nearest', methods=['GET'])
+@login_required
+@use_args(nearest_args)
+def get_nearest_users(args, id):
+    return nearest_response(id, nearby_users, args)
@@ -2,7 +2,7 @@ from flask import Blueprint, g
 from webargs import fields
 from webargs.flaskparser import use_args
 
-from project import db
+from project import app, db
 from project.api.models.enums import ResponseType
 from project.api.models import Project, User, Tag, ProjectResponse
 from project.api.schemas import (
@@ -11,7 +11,10 @@ from project.api.schemas import (
     ProjectResponseSchema
 )
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response, set_tags
+from project.api.common.matching import candidates
+from project.api.common.geo import locations_changed
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema, set_tags)
 
 
 bp_project = Blueprint('project', __name__)
@@ -33,12 +36,16 @@ save_args = {
     'highlight': fields.Boolean()
 }
 
+candidate_args = {
+    'limit': fields.Integer(validate=lambda limit: limit > 0)
+}
+
 
 @bp_project.route('/<id>', methods=['GET'])
 @login_required
 @use_args(args)
 def get_project_detail(args, id):
-    project = Project.query.get(id)
+    project = sparse_query(Project.query, project_schema).get(id)
     if not project:
         return make_response(
             status_code=404,
@@ -48,17 +55,13 @@ def get_project_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=project_schema.dump(project).data)
+        data=sparse_schema(project_schema).dump(project).data)
 
 
 @bp_project.route('/', methods=['GET'])
 @login_required
 def fetch_project_list():
-    projects = Project.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=projects_schema.dump(projects).data)
+    return make_list_response(Project.query, projects_schema)
 
 
 @bp_project.route('/', methods=['POST'])
@@ -116,6 +119,7 @@ def delete_project(args, id):
 
     db.session.delete(project)
     db.session.commit()
+    locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -131,22 +135,19 @@ project_response_filter_args = {
 @bp_project.route('/<id>/project_response', methods=['GET'])
 @login_required
 @use_args(project_response_filter_args)
-def get_project_response_list(id, args):
-    project_responses = ProjectResponse.query.filter_by(project_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=ProjectResponseSchema(many=True).dump(project_responses).data)
+def get_project_response_list(args, id):
+    project_responses = ProjectResponse.query.filter_by(project_id=id)
+    if args.get('type'):
+        project_responses = project_responses.filter_by(type=args['type'])
+    return make_list_response(
+        project_responses, ProjectResponseSchema(many=True))
 
 
 @bp_project.route('/<id>/tag', methods=['GET'])
 @login_required
 def get_tag_list(id):
-    tags = Tag.query.filter_by(project_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=TagSchema(many=True).dump(tags).data)
+    return make_list_response(
+        Tag.query.filter_by(project_id=id), TagSchema(many=True))
 
 
 tags_arg = {
@@ -182,3 +183,23 @@ def set_project_tags(args, id):
         status_code=200,
         status='success',
         data=TagSchema(many=True).dump(tags).data)
+
+
+@bp_project.route('/<id>/candidates', methods=['GET'])
+@login_required
+@use_args(candidate_args)
+def get_project_candidates(args, id):
+    project = Project.query.get(id)
+    if not project:
+        return make_response(
+            status_code=404,
+            status='failure',
+            message='No project found with that id')
+
+    limit = min(
+        args.get('limit') or app.config.get('MATCHING_CANDIDATE_LIMIT'),
+        app.config.get('PAGINATION_MAX_LIMIT'))
+    return make_response(
+        status_code=200,
+        status='success',
+        data=candidates.rank(project, limit))
@@ -6,7 +6,8 @@ from project import db
 from project.api.models import ProjectResponse, User, Project
 from project.api.schemas import ProjectResponseSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 from project.api.models.enums import ResponseType
 
 bp_project_response = Blueprint('project_response', __name__)
@@ -30,7 +31,8 @@ save_args = {
 @login_required
 @use_args(args)
 def get_project_response_detail(args, id):
-    project_response = ProjectResponse.query.get(id)
+    project_response = sparse_query(
+        ProjectResponse.query, project_response_schema).get(id)
     if not project_response:
         return make_response(
             status_code=404,
@@ -40,17 +42,14 @@ def get_project_response_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=project_response_schema.dump(project_response).data)
+        data=sparse_schema(
+            project_response_schema).dump(project_response).data)
 
 
 @bp_project_response.route('/', methods=['GET'])
 @login_required
 def get_project_response_list():
-    project_responses = ProjectResponse.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=project_responses_schema.dump(project_responses).data)
+    return make_list_response(ProjectResponse.query, project_responses_schema)
 
 
 @bp_project_response.route('/', methods=['POST'])
@@ -6,7 +6,8 @@ from project import db
 from project.api.models import Role
 from project.api.schemas import RoleSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_role = Blueprint('role', __name__)
@@ -28,7 +29,7 @@ save_args = {
 @login_required
 @use_args(args)
 def get_role_detail(args, id):
-    role = Role.query.get(id)
+    role = sparse_query(Role.query, role_schema).get(id)
     if not role:
         return make_response(
             status_code=404,
@@ -38,17 +39,13 @@ def get_role_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=role_schema.dump(role).data)
+        data=sparse_schema(role_schema).dump(role).data)
 
 
 @bp_role.route('/', methods=['GET'])
 @login_required
 def fetch_role_list():
-    roles = Role.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=roles_schema.dump(roles).data)
+    return make_list_response(Role.query, roles_schema)
 
 
 @bp_role.route('/', methods=['POST'])
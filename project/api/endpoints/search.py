@@ -0,0 +1,92 @@
+from flask import Blueprint, request, url_for
+from sqlalchemy import (
+    func, select, literal, cast, union_all, and_, or_, tuple_)
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from webargs import fields
+from webargs.flaskparser import use_args
+
+from project import app, db
+from project.api.models import searchable
+from project.api.common.decorators import login_required
+from project.api.common.utils import make_response
+
+
+bp_search = Blueprint('search', __name__)
+
+search_args = {
+    'q': fields.String(required=True),
+    'type': fields.DelimitedList(
+        fields.String(validate=lambda t: t in searchable)),
+    'limit': fields.Integer(validate=lambda limit: limit > 0),
+    'after': fields.String()
+}
+
+
+def parse_cursor(after):
+    """
+    Splits an `after` cursor of the form rank:type:id
+    :return: (float, str, int)
+    """
+    rank, type, id = after.split(':')
+    return float(rank), type, int(id)
+
+
+@bp_search.route('/', methods=['GET'])
+@login_required
+@use_args(search_args)
+def search(args):
+    config = app.config.get('SEARCH_CONFIG')
+    limit = min(
+        args.get('limit') or app.config.get('PAGINATION_DEFAULT_LIMIT'),
+        app.config.get('PAGINATION_MAX_LIMIT'))
+    query = func.websearch_to_tsquery(config, args['q'])
+
+    documents = []
+    for type in sorted(args.get('type') or searchable):
+        model = searchable[type]
+        vector = model.search_vector()
+        documents.append(select([
+            literal(type).label('type'),
+            model.id.label('id'),
+            getattr(model, model.search_title).label('title'),
+            getattr(model, model.search_headline).label('body'),
+            # Ranks are compared against cursors parsed back from text, so
+            # widen them to a type that round-trips through Python floats
+            cast(func.ts_rank(vector, query), DOUBLE_PRECISION).label('rank')
+        ]).where(vector.op('@@')(query)))
+    results = union_all(*documents).alias('results')
+    order = (results.c.rank.desc(), results.c.type, results.c.id)
+
+    page = select([results])
+    if args.get('after'):
+        try:
+            rank, type, id = parse_cursor(args['after'])
+        except ValueError:
+            return make_response(
+                status_code=400,
+                status='failure',
+                message='Invalid cursor')
+        page = page.where(or_(
+            results.c.rank < rank,
+            and_(results.c.rank == rank,
+                 tuple_(results.c.type, results.c.id) > tuple_(type, id))))
+    # Headlines are the expensive part, so only build them for the page
+    page = page.order_by(*order).limit(limit + 1).alias('page')
+    rows = db.session.execute(select([
+        page.c.type, page.c.id, page.c.title, page.c.rank,
+        func.ts_headline(config, page.c.body, query).label('headline')
+    ]).order_by(page.c.rank.desc(), page.c.type, page.c.id)).fetchall()
+
+    links = {'self': request.url}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.args.to_dict()
+        params.update(limit=limit, after='{!r}:{}:{}'.format(
+            rows[-1].rank, rows[-1].type, rows[-1].id))
+        links['next'] = url_for(request.endpoint, _external=True, **params)
+
+    return make_response(
+        status_code=200,
+        status='success',
+        data=[dict(row) for row in rows],
+        links=links)
@@ -1,13 +1,14 @@
 from flask import Blueprint
-from sqlalchemy import func
 from webargs import fields
 from webargs.flaskparser import use_args
 
-from project import db
+from project import app, db
 from project.api.models import Tag
 from project.api.schemas import TagSchema
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response
+from project.api.common.indexes import tag_suggestions, tags_changed
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema)
 
 
 bp_tag = Blueprint('tag', __name__)
@@ -23,12 +24,17 @@ save_args = {
     'title': fields.String(50, required=True)
 }
 
+suggestion_args = {
+    'q': fields.String(missing=''),
+    'limit': fields.Integer(validate=lambda limit: limit > 0)
+}
+
 
 @bp_tag.route('/<id>', methods=['GET'])
 @login_required
 @use_args(args)
 def get_tag_detail(args, id):
-    tag = Tag.query.get(id)
+    tag = sparse_query(Tag.query, tag_schema).get(id)
     if not tag:
         return make_response(
             status_code=404,
@@ -38,28 +44,26 @@ def get_tag_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=tag_schema.dump(tag).data)
+        data=sparse_schema(tag_schema).dump(tag).data)
 
 
 @bp_tag.route('/', methods=['GET'])
 @login_required
 def fetch_tag_list():
-    tags = Tag.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=tags_schema.dump(tags).data)
+    return make_list_response(Tag.query, tags_schema)
 
 
 @bp_tag.route('/list')
-def fetch_tag_list_suggestions():
-    tags = Tag.query.with_entities(
-        Tag.title, func.count(Tag.title)).group_by(Tag.title).all()
+@use_args(suggestion_args)
+def fetch_tag_list_suggestions(args):
+    limit = min(
+        args.get('limit') or app.config.get('TAG_SUGGESTION_LIMIT'),
+        app.config.get('TAG_SUGGESTION_MAX_LIMIT'))
 
     return make_response(
         status_code=200,
         status='success',
-        data=tags_schema.dump(tags).data)
+        data=tag_suggestions.suggest(args['q'], limit))
 
 
 @bp_tag.route('/<id>', methods=['PUT'])
@@ -69,6 +73,7 @@ def update_tag(args, id):
     tag = Tag.query.get(id)
     tag.update(**args)
     db.session.commit()
+    tags_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -89,6 +94,7 @@ def delete_tag(args, id):
 
     db.session.delete(tag)
     db.session.commit()
+    tags_changed()
     return make_response(
         status_code=200,
         status='success',
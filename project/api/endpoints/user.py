@@ -1,4 +1,5 @@
 from flask import Blueprint
+from sqlalchemy import and_
 from webargs import fields
 from webargs.flaskparser import use_args
 
@@ -9,7 +10,8 @@ from project.api.models import (
     ProjectResponse,
     WorkExperience,
     Tag,
-    Activity
+    Activity,
+    FeedItem
 )
 from project.api.schemas import (
     UserSchema,
@@ -20,7 +22,10 @@ from project.api.schemas import (
     ActivitySchema
 )
 from project.api.common.decorators import login_required, admin_required
-from project.api.common.utils import make_response, set_tags
+from project.api.common.indexes import user_skills, parse_query
+from project.api.common.geo import locations_changed
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema, set_tags)
 
 
 bp_user = Blueprint('user', __name__)
@@ -32,10 +37,15 @@ user_args = {
     'id': fields.Integer(required=True, location='view_args')
 }
 
+search_args = {
+    'q': fields.String(required=True)
+}
+
 save_args = {
     'name': fields.String(),
     'group_id': fields.Integer(allow_none=True),
-    'role_id': fields.Integer(allow_none=True)
+    'role_id': fields.Integer(allow_none=True),
+    'location_id': fields.Integer(allow_none=True)
 }
 
 
@@ -43,7 +53,7 @@ save_args = {
 @login_required
 @use_args(user_args)
 def get_user_detail(args, id):
-    user = User.query.get(id)
+    user = sparse_query(User.query, user_schema).get(id)
     if not user:
         return make_response(
             status_code=404,
@@ -53,18 +63,30 @@ def get_user_detail(args, id):
         status_code=200,
         status='success',
         message=None,
-        data=user_schema.dump(user).data)
+        data=sparse_schema(user_schema).dump(user).data)
 
 
 @bp_user.route('/', methods=['GET'])
 @login_required
 def get_user_list():
-    users = User.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        message=None,
-        data=users_schema.dump(users).data)
+    return make_list_response(User.query, users_schema)
+
+
+@bp_user.route('/search', methods=['GET'])
+@login_required
+@use_args(search_args)
+def search_users(args):
+    try:
+        clauses = parse_query(args['q'])
+    except ValueError as e:
+        return make_response(
+            status_code=400,
+            status='failure',
+            message=str(e))
+
+    user_ids = user_skills.search(clauses)
+    return make_list_response(
+        User.query.filter(User.id.in_(user_ids)), users_schema)
 
 
 @bp_user.route('/<id>', methods=['PUT'])
@@ -74,6 +96,8 @@ def update_user(args, id):
     user = User.query.get(id)
     user.update(**args)
     db.session.commit()
+    if 'location_id' in args:
+        locations_changed()
     return make_response(
         status_code=200,
         status='success',
@@ -98,51 +122,49 @@ def verify_user(id):
 @bp_user.route('/<id>/education', methods=['GET'])
 @login_required
 def get_education_list(id):
-    educations = Education.query.filter_by(user_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=EducationSchema(many=True).dump(educations).data)
+    return make_list_response(
+        Education.query.filter_by(user_id=id), EducationSchema(many=True))
 
 
 @bp_user.route('/<id>/project_response', methods=['GET'])
 @login_required
 def get_project_response_list(id):
-    project_responses = ProjectResponse.query.filter_by(user_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=ProjectResponseSchema(many=True).dump(project_responses).data)
+    return make_list_response(
+        ProjectResponse.query.filter_by(user_id=id),
+        ProjectResponseSchema(many=True))
 
 
 @bp_user.route('/<id>/workexperience', methods=['GET'])
 @login_required
 def get_work_experience_list(id):
-    work_experience = WorkExperience.query.filter_by(user_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=WorkExperienceSchema(many=True).dump(work_experience).data)
+    return make_list_response(
+        WorkExperience.query.filter_by(user_id=id),
+        WorkExperienceSchema(many=True))
 
 
 @bp_user.route('/<id>/activity', methods=['GET'])
 @login_required
 def get_user_activity_list(id):
-    activities = Activity.query.filter_by(user_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=ActivitySchema(many=True).dump(activities).data)
+    return make_list_response(
+        Activity.query.filter_by(user_id=id), ActivitySchema(many=True))
+
+
+@bp_user.route('/<id>/feed', methods=['GET'])
+@login_required
+def get_user_feed(id):
+    activities = Activity.query.join(FeedItem, and_(
+        FeedItem.activity_id == Activity.id,
+        FeedItem.created == Activity.created)).filter(
+            FeedItem.user_id == id)
+    return make_list_response(
+        activities, ActivitySchema(many=True), reverse=True)
 
 
 @bp_user.route('/<id>/tag', methods=['GET'])
 @login_required
 def get_tag_list(id):
-    tags = Tag.query.filter_by(user_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=TagSchema(many=True).dump(tags).data)
+    return make_list_response(
+        Tag.query.filter_by(user_id=id), TagSchema(many=True))
 
 
 tags_arg = {
@@ -10,7 +10,8 @@ from project.api.schemas import (
     ActivitySchema
 )
 from project.api.common.decorators import login_required
-from project.api.common.utils import make_response, set_tags
+from project.api.common.utils import (
+    make_response, make_list_response, sparse_query, sparse_schema, set_tags)
 
 
 bp_work_experience = Blueprint('work_experience', __name__)
@@ -37,7 +38,8 @@ save_args = {
 @login_required
 @use_args(args)
 def get_work_experience_detail(args, id):
-    work_experience = WorkExperience.query.get(id)
+    work_experience = sparse_query(
+        WorkExperience.query, work_experience_schema).get(id)
     if not work_experience:
         return make_response(
             status_code=404,
@@ -47,17 +49,13 @@ def get_work_experience_detail(args, id):
     return make_response(
         status_code=200,
         status='success',
-        data=work_experience_schema.dump(work_experience).data)
+        data=sparse_schema(work_experience_schema).dump(work_experience).data)
 
 
 @bp_work_experience.route('/', methods=['GET'])
 @login_required
 def fetch_work_experience_list():
-    work_experiences = WorkExperience.query.all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=work_experiences_schema.dump(work_experiences).data)
+    return make_list_response(WorkExperience.query, work_experiences_schema)
 
 
 @bp_work_experience.route('/', methods=['POST'])
@@ -125,11 +123,8 @@ def delete_work_experience(args, id):
 @bp_work_experience.route('/<id>/tag', methods=['GET'])
 @login_required
 def get_tag_list(id):
-    tags = Tag.query.filter_by(work_experience_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=TagSchema(many=True).dump(tags).data)
+    return make_list_response(
+        Tag.query.filter_by(work_experience_id=id), TagSchema(many=True))
 
 
 tags_arg = {
@@ -170,8 +165,6 @@ def set_work_experience_tags(args, id):
 @bp_work_experience.route('/<id>/activity', methods=['GET'])
 @login_required
 def get_user_activity_list(id):
-    activities = Activity.query.filter_by(work_experience_id=id).all()
-    return make_response(
-        status_code=200,
-        status='success',
-        data=ActivitySchema(many=True).dump(activities).data)
+    return make_list_response(
+        Activity.query.filter_by(work_experience_id=id),
+        ActivitySchema(many=True))
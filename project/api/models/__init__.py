@@ -1,11 +1,22 @@
+import re
 import jwt
+import time
+import uuid
+import hashlib
+import calendar
 import datetime
+import threading
+from collections import defaultdict
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy import event, inspect
+from sqlalchemy import (
+    event, inspect, select, func, cast, literal, literal_column, and_, text,
+    union, DDL)
 from flask import g
 from sqlalchemy_utils.types.choice import ChoiceType
 
-from project import app, db, bcrypt
+from project import app, db
+from project.api.common import hashing
+from project.api.common.stream import Listener
 from .enums import UserType, EducationType, ResponseType
 
 
@@ -30,14 +41,27 @@ class BaseMixin(object):
     def updated_by(self):
         return db.relationship('User', foreign_keys=[self.updated_by_user_id])
 
-    @property
-    def _descriptive(self):
-        return self.id
+    _descriptive = db.Column(db.String(255))
+
+    def describe(self):
+        """
+        Returns the label shown for this row wherever it is referenced. It is
+        stored in the _descriptive column on every insert and update so
+        serializing a reference never has to load anything else.
+        """
+        return None
 
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    def activity_state(self):
+        """
+        Returns what activity_values needs to know about this row as it was
+        when the change happened, stored with the outbox entry
+        """
+        return None
+
     @staticmethod
     def after_insert(mapper, connection, target):
         pass
@@ -50,10 +74,12 @@ class BaseMixin(object):
     def before_update(mapper, connection, target):
         target.timestamp = datetime.datetime.utcnow()
         target.updated_by_user_id = getattr(g, 'user_id', None)
+        target._descriptive = target.describe()
 
     @staticmethod
     def before_insert(mapper, connection, target):
         target.created_by_user_id = getattr(g, 'user_id', None)
+        target._descriptive = target.describe()
 
     @classmethod
     def __declare_last__(cls):
@@ -63,10 +89,64 @@ class BaseMixin(object):
         event.listen(cls, 'after_insert', cls.after_insert)
 
 
+def update_descriptive(connection, table, labels, batch_size=1000):
+    """
+    Stores (id, label) pairs with one UPDATE ... FROM (VALUES ...) per
+    batch_size rows
+    """
+    for start in range(0, len(labels), batch_size):
+        params = {}
+        values = []
+        for index, (row_id, label) in enumerate(
+                labels[start:start + batch_size]):
+            values.append('(:id{0}, :label{0})'.format(index))
+            params['id{}'.format(index)] = row_id
+            params['label{}'.format(index)] = label
+        connection.execute(text(
+            'UPDATE "{0}" SET _descriptive = v.label '
+            'FROM (VALUES {1}) AS v (id, label) '
+            'WHERE "{0}".id = v.id'.format(table.name, ', '.join(values))),
+            params)
+
+
 class ExperienceMixin(object):
     highlight = db.Column(db.Boolean, default=False)
 
 
+class SearchableMixin(object):
+    """
+    Models with a full-text search document. Postgres maintains it in a
+    generated search_vector column, built from search_fields as (column,
+    weight) pairs, with a GIN index on it. The column is left unmapped so
+    the ORM never writes it; see search_ddl.
+    """
+    search_fields = ()
+    search_title = 'title'
+    search_headline = 'description'
+
+    @classmethod
+    def search_ddl(cls):
+        """
+        Statements adding the search column and index, safe to run again on
+        a database that already has them
+        :return: list
+        """
+        table = cls.__tablename__
+        document = ' || '.join(
+            "setweight(to_tsvector('{}', coalesce({}, '')), '{}')".format(
+                app.config.get('SEARCH_CONFIG'), column, weight)
+            for column, weight in cls.search_fields)
+        return [
+            'ALTER TABLE {} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            'GENERATED ALWAYS AS ({}) STORED'.format(table, document),
+            'CREATE INDEX IF NOT EXISTS ix_{0}_search_vector '
+            'ON {0} USING GIN (search_vector)'.format(table)]
+
+    @classmethod
+    def search_vector(cls):
+        return literal_column('{}.search_vector'.format(cls.__tablename__))
+
+
 class User(BaseMixin, db.Model):
     """ User Model for storing user related details """
     email = db.Column(db.String(255), unique=True, nullable=False)
@@ -78,23 +158,31 @@ class User(BaseMixin, db.Model):
         nullable=False,
         default=datetime.datetime.utcnow())
     admin = db.Column(db.Boolean, nullable=False, default=False)
+    token_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
     user_type = db.Column(ChoiceType(UserType, impl=db.Integer()))
 
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'))
     group = db.relationship('Group', foreign_keys=[group_id], backref='users')
 
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'))
+    location = db.relationship('Location', backref='users')
+
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'))
     role = db.relationship('Role', foreign_keys=[role_id], backref='users')
 
-    @property
-    def _descriptive(self):
+    def describe(self):
         return self.name
 
+    @staticmethod
+    def after_update(mapper, connection, target):
+        if inspect(target).attrs.name.history.has_changes():
+            ProjectResponse.refresh_descriptive(
+                connection, ProjectResponse.user_id == target.id)
+
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
-        self.password = bcrypt.generate_password_hash(
-            kwargs['password'], app.config.get('BCRYPT_LOG_ROUNDS')
-        ).decode()
+        self.password = hashing.generate_password_hash(kwargs['password'])
 
     def encode_auth_token(self, days=1):
         """
@@ -105,7 +193,9 @@ class User(BaseMixin, db.Model):
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=days),
             'iat': datetime.datetime.utcnow(),
             'sub': self.id,
-            'admin': self.admin
+            'admin': self.admin,
+            'jti': uuid.uuid4().hex,
+            'ver': self.token_version or 0
         }
         return jwt.encode(
             payload,
@@ -113,8 +203,72 @@ class User(BaseMixin, db.Model):
             algorithm='HS256'
         ).decode('utf-8')
 
+    # Process wide cache of user id -> (token_version, time fetched)
+    _token_versions = {}
+
+    @staticmethod
+    def current_token_version(user_id):
+        """
+        Returns the token version of a user, read from the database at most
+        once every TOKEN_VERSION_REFRESH_SECONDS per process.
+        :return: integer|None
+        """
+        interval = app.config.get('TOKEN_VERSION_REFRESH_SECONDS', 0)
+        cached = User._token_versions.get(user_id)
+        if cached and time.monotonic() - cached[1] < interval:
+            return cached[0]
+        version = db.session.query(User.token_version).filter(
+            User.id == user_id).scalar()
+        User._token_versions[user_id] = (version, time.monotonic())
+        return version
+
+    def revoke_auth_tokens(self):
+        """
+        Invalidates every token issued to this user so far
+        """
+        self.token_version = User.token_version + 1
+        db.session.commit()
+        User._token_versions[self.id] = (
+            self.token_version, time.monotonic())
+
     def check_password_hash(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        return hashing.check_password_hash(self.password, password)
+
+    def schedule_rehash(self, password):
+        """
+        Rehashes the password with the configured cost in the background if
+        the stored hash uses a different one. Skipped when the pool is busy.
+        """
+        if not hashing.needs_rehash(self.password):
+            return
+        try:
+            hashing.submit(
+                User._rehash_password, self.id, self.password, password)
+        except hashing.HashingUnavailable:
+            pass
+
+    @staticmethod
+    def _rehash_password(user_id, old_hash, password):
+        new_hash = hashing.bcrypt.generate_password_hash(
+            password, app.config.get('BCRYPT_LOG_ROUNDS')).decode()
+        with app.app_context():
+            # Only replace the hash that was verified, never a newer password
+            User.query.filter_by(id=user_id, password=old_hash).update(
+                {'password': new_hash}, synchronize_session=False)
+            db.session.commit()
+
+    @staticmethod
+    def token_id(auth_token, payload):
+        """
+        Returns the jti claim of a token. Tokens issued before the claim was
+        introduced are identified by a digest of the token itself.
+        :return: string
+        """
+        if payload.get('jti'):
+            return payload['jti']
+        if isinstance(auth_token, str):
+            auth_token = auth_token.encode('utf-8')
+        return hashlib.sha256(auth_token).hexdigest()[:32]
 
     @staticmethod
     def decode_auth_token(auth_token):
@@ -125,11 +279,15 @@ class User(BaseMixin, db.Model):
         """
         try:
             payload = jwt.decode(auth_token, app.config.get('SECRET_KEY'))
-            is_blacklisted_token = BlacklistToken.check_blacklist(auth_token)
+            payload['jti'] = User.token_id(auth_token, payload)
+            is_blacklisted_token = BlacklistToken.check_blacklist(
+                payload['jti'])
             if is_blacklisted_token:
                 return 'Token blacklisted. Please log in again.'
-            else:
-                return payload
+            version = User.current_token_version(payload['sub'])
+            if payload.get('ver', 0) != version:
+                return 'Token revoked. Please log in again.'
+            return payload
         except jwt.ExpiredSignatureError:
             return 'Signature expired. Please log in again.'
         except jwt.InvalidTokenError:
@@ -138,29 +296,261 @@ class User(BaseMixin, db.Model):
 
 class BlacklistToken(db.Model):
     """
-    Token Model for storing JWT tokens
+    Token Model for storing revoked JWT ids until the token expires
     """
     __tablename__ = 'blacklist_tokens'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(500), unique=True, nullable=False)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    # Rows that predate the column never expire until convert_legacy has
+    # filled in their real expiry
+    expires = db.Column(
+        db.DateTime, nullable=False, index=True,
+        server_default=text("'9999-12-31'"))
     blacklisted_on = db.Column(db.DateTime, nullable=False)
 
-    def __init__(self, token):
-        self.token = token
+    def __init__(self, jti, expires):
+        self.jti = jti
+        self.expires = expires
         self.blacklisted_on = datetime.datetime.now()
 
+    # NOTIFY channel announcing every revocation to all worker processes
+    channel = 'blacklist_tokens'
+
+    # Process wide cache of revoked token ids and their expiry. Revocations
+    # are pushed in through the channel; a periodic full reload of the
+    # unexpired rows covers notifications missed while reconnecting.
+    _revoked = {}
+    _revoked_refreshed = None
+    _revoked_lock = threading.Lock()
+
     def __repr__(self):
-        return '<id: token: {}'.format(self.token)
+        return '<id: jti: {}'.format(self.jti)
+
+    @classmethod
+    def refresh_cache(cls, force=False):
+        """
+        Reloads the unexpired blacklisted tokens, at most once every
+        TOKEN_BLACKLIST_REFRESH_SECONDS unless forced. This is what makes a
+        logout in one worker process visible to the others.
+        """
+        interval = app.config.get('TOKEN_BLACKLIST_REFRESH_SECONDS', 0)
+        refreshed = cls._revoked_refreshed
+        if not force and refreshed is not None and \
+                time.monotonic() - refreshed < interval:
+            return
+        with cls._revoked_lock:
+            now = datetime.datetime.utcnow()
+            revoked = dict(db.session.query(cls.jti, cls.expires).filter(
+                cls.expires >= now))
+            # Keep entries added locally by add_to_cache while the query ran;
+            # a revocation is never undone before it expires.
+            for jti, expires in list(cls._revoked.items()):
+                if expires >= now:
+                    revoked.setdefault(jti, expires)
+            cls._revoked = revoked
+            cls._revoked_refreshed = time.monotonic()
+
+    @classmethod
+    def add_to_cache(cls, jti, expires):
+        cls._revoked[jti] = expires
+
+    @classmethod
+    def on_notify(cls, payloads):
+        if payloads is None:
+            # Revocations may have been missed, reload on the next check
+            cls._revoked_refreshed = None
+            return
+        with cls._revoked_lock:
+            for payload in payloads:
+                jti, expires = payload.split(' ', 1)
+                cls._revoked[jti] = datetime.datetime.utcfromtimestamp(
+                    int(expires))
+
+    def announce(self):
+        """
+        Queues a notification of this revocation, delivered to every worker
+        process when the transaction commits
+        """
+        db.session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': BlacklistToken.channel,
+             'payload': '{} {}'.format(
+                 self.jti, calendar.timegm(self.expires.utctimetuple()))})
 
     @staticmethod
-    def check_blacklist(auth_token):
-        # check whether auth token has been blacklisted
-        res = BlacklistToken.query.filter_by(token=str(auth_token)).first()
-        if res:
-            return True
-        else:
-            return False
+    def check_blacklist(jti):
+        # check whether the token id has been blacklisted
+        blacklist_listener.start()
+        BlacklistToken.refresh_cache()
+        return jti in BlacklistToken._revoked
+
+    @staticmethod
+    def convert_legacy(connection, batch_size=1000):
+        """
+        Converts a blacklist_tokens table still in the old layout, holding
+        whole tokens, to jti and expires. Legacy tokens get the digest id
+        User.token_id gives them and the expiry from their exp claim, so
+        they stay revoked. Does nothing on a converted table.
+        :return: number of converted rows
+        """
+        columns = set(column['name'] for column in
+                      inspect(connection).get_columns('blacklist_tokens'))
+        if 'token' not in columns:
+            return 0
+
+        connection.execute(text(
+            'ALTER TABLE blacklist_tokens '
+            'ADD COLUMN IF NOT EXISTS jti VARCHAR(32), '
+            'ADD COLUMN IF NOT EXISTS expires TIMESTAMP WITHOUT TIME ZONE'))
+        rows = connection.execute(text(
+            'SELECT id, token FROM blacklist_tokens '
+            'WHERE jti IS NULL')).fetchall()
+        converted = []
+        for row_id, token in rows:
+            try:
+                payload = jwt.decode(token, verify=False)
+            except jwt.InvalidTokenError:
+                payload = {}
+            # A token we cannot read stays revoked for good
+            expires = datetime.datetime.utcfromtimestamp(payload['exp']) \
+                if payload.get('exp') else datetime.datetime(9999, 12, 31)
+            converted.append(
+                (row_id, User.token_id(token, payload), expires))
+
+        for start in range(0, len(converted), batch_size):
+            params = {}
+            values = []
+            for index, (row_id, jti, expires) in enumerate(
+                    converted[start:start + batch_size]):
+                values.append('(:id{0}, :jti{0}, :expires{0})'.format(index))
+                params.update({'id{}'.format(index): row_id,
+                               'jti{}'.format(index): jti,
+                               'expires{}'.format(index): expires})
+            connection.execute(text(
+                'UPDATE blacklist_tokens SET jti = v.jti, expires = v.expires '
+                'FROM (VALUES {}) AS v (id, jti, expires) '
+                'WHERE blacklist_tokens.id = v.id'.format(', '.join(values))),
+                params)
+
+        connection.execute(text(
+            'ALTER TABLE blacklist_tokens '
+            'ALTER COLUMN jti SET NOT NULL, '
+            'ALTER COLUMN expires SET NOT NULL, '
+            'ADD CONSTRAINT blacklist_tokens_jti_key UNIQUE (jti), '
+            'DROP COLUMN token'))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_blacklist_tokens_expires '
+            'ON blacklist_tokens (expires)'))
+        return len(converted)
+
+    @staticmethod
+    def prune():
+        """
+        Deletes blacklist entries for tokens that have expired anyway
+        :return: number of deleted rows
+        """
+        deleted = BlacklistToken.query.filter(
+            BlacklistToken.expires < datetime.datetime.utcnow()).delete(
+                synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+class ClosureTable(object):
+    """
+    Ancestor/descendant pairs of a self referencing hierarchy, including
+    every node paired with itself at depth 0. Kept up to date from the
+    mapper hooks of the hierarchy model, so subtree lookups are a single
+    indexed join instead of a recursive query.
+    """
+
+    def __init__(self, name, target, metadata=None):
+        self.table = db.Table(
+            name,
+            metadata if metadata is not None else db.metadata,
+            db.Column('ancestor_id', db.Integer, db.ForeignKey(
+                '{}.id'.format(target), ondelete='CASCADE'),
+                primary_key=True),
+            db.Column('descendant_id', db.Integer, db.ForeignKey(
+                '{}.id'.format(target), ondelete='CASCADE'),
+                primary_key=True, index=True),
+            db.Column('depth', db.Integer, nullable=False))
+
+    def insert_node(self, connection, node_id, parent_id):
+        c = self.table.c
+        connection.execute(self.table.insert().values(
+            ancestor_id=node_id, descendant_id=node_id, depth=0))
+        if parent_id is None:
+            return
+        connection.execute(self.table.insert().from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select([c.ancestor_id, literal(node_id), c.depth + 1]).where(
+                c.descendant_id == parent_id)))
+
+    def move_node(self, connection, node_id, parent_id):
+        c = self.table.c
+        current_parent_id = connection.execute(
+            select([c.ancestor_id]).where(
+                and_(c.descendant_id == node_id, c.depth == 1))).scalar()
+        if current_parent_id == parent_id:
+            return
+
+        subtree = select([c.descendant_id]).where(c.ancestor_id == node_id)
+        connection.execute(self.table.delete().where(and_(
+            c.descendant_id.in_(subtree), ~c.ancestor_id.in_(subtree))))
+        if parent_id is None:
+            return
+        above = self.table.alias('above')
+        below = self.table.alias('below')
+        connection.execute(self.table.insert().from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select([above.c.ancestor_id, below.c.descendant_id,
+                    above.c.depth + below.c.depth + 1]).where(and_(
+                        above.c.descendant_id == parent_id,
+                        below.c.ancestor_id == node_id))))
+
+    def rebuild(self, connection, parents):
+        """
+        Recreates every pair from a {node id: parent id} mapping
+        """
+        rows = []
+        for node_id in parents:
+            ancestor_id, depth = node_id, 0
+            while ancestor_id is not None:
+                rows.append({'ancestor_id': ancestor_id,
+                             'descendant_id': node_id,
+                             'depth': depth})
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        connection.execute(self.table.delete())
+        if rows:
+            connection.execute(self.table.insert(), rows)
+
+    def descendants(self, node_id):
+        c = self.table.c
+        return select([c.descendant_id]).where(c.ancestor_id == node_id)
+
+    def users_by_ancestor(self, node_ids, user_column):
+        """
+        Returns the ids of the users in the subtree of each node with a
+        single query, as {node id: [row with .id, ...]}
+        """
+        c = self.table.c
+        rows = db.session.query(c.ancestor_id, User.id).join(
+            User, user_column == c.descendant_id).filter(
+                c.ancestor_id.in_(node_ids)).all()
+        users = defaultdict(list)
+        for row in rows:
+            users[row.ancestor_id].append(row)
+        return users
+
+
+blacklist_listener = Listener(
+    BlacklistToken.channel, BlacklistToken.on_notify)
+
+
+role_closure = ClosureTable('role_closure', 'role')
+group_closure = ClosureTable('group_closure', 'group')
 
 
 class Role(BaseMixin, db.Model):
@@ -172,23 +562,36 @@ class Role(BaseMixin, db.Model):
 
     @property
     def all_users_id(self):
-        all_roles = [item.id for item in self.get_children_list(self.id)]
-        all_users = db.session.query(User).filter(
-            User.role_id.in_(all_roles)).all()
-        return all_users
+        if getattr(self, '_preloaded_users', None) is not None:
+            return self._preloaded_users
+        closure = role_closure.table
+        return User.query.join(
+            closure, closure.c.descendant_id == User.role_id).filter(
+                closure.c.ancestor_id == self.id).all()
+
+    @staticmethod
+    def preload_all_users(roles):
+        users = role_closure.users_by_ancestor(
+            [role.id for role in roles], User.role_id)
+        for role in roles:
+            role._preloaded_users = users.get(role.id, [])
 
     @staticmethod
     def get_children_list(role_id):
-        beginning_getter = db.session.query(Role).\
-            filter(Role.id == role_id).cte(name='children_for', recursive=True)
-        with_recursive = beginning_getter.union_all(
-            db.session.query(Role).filter(
-                Role.main_role_id == beginning_getter.c.id, Role.id != role_id)
-        )
-        return db.session.query(with_recursive).all()
+        return Role.query.filter(
+            Role.id.in_(role_closure.descendants(role_id))).all()
 
-    @property
-    def _descriptive(self):
+    @staticmethod
+    def after_insert(mapper, connection, target):
+        role_closure.insert_node(connection, target.id, target.main_role_id)
+
+    @staticmethod
+    def after_update(mapper, connection, target):
+        if inspect(target).attrs.main_role_id.history.has_changes():
+            role_closure.move_node(
+                connection, target.id, target.main_role_id)
+
+    def describe(self):
         return self.name
 
 
@@ -205,27 +608,40 @@ class Group(BaseMixin, db.Model):
     main_group = db.relationship(
         'Group', remote_side=[id], backref='subgroups')
 
-    @property
-    def _descriptive(self):
+    def describe(self):
         return self.name
 
     @property
     def all_users_id(self):
-        all_groups = [item.id for item in self.get_children_list(self.id)]
-        all_users = db.session.query(User).filter(
-            User.group_id.in_(all_groups)).all()
-        return all_users
+        if getattr(self, '_preloaded_users', None) is not None:
+            return self._preloaded_users
+        closure = group_closure.table
+        return User.query.join(
+            closure, closure.c.descendant_id == User.group_id).filter(
+                closure.c.ancestor_id == self.id).all()
+
+    @staticmethod
+    def preload_all_users(groups):
+        users = group_closure.users_by_ancestor(
+            [group.id for group in groups], User.group_id)
+        for group in groups:
+            group._preloaded_users = users.get(group.id, [])
 
     @staticmethod
     def get_children_list(group_id):
-        beginning_getter = db.session.query(Group).\
-            filter(Group.id == group_id).cte(
-                name='children_for', recursive=True)
-        with_recursive = beginning_getter.union_all(
-            db.session.query(Group).filter(
-                Group.main_group_id == beginning_getter.c.id)
-        )
-        return db.session.query(with_recursive).all()
+        return Group.query.filter(
+            Group.id.in_(group_closure.descendants(group_id))).all()
+
+    @staticmethod
+    def after_insert(mapper, connection, target):
+        group_closure.insert_node(
+            connection, target.id, target.main_group_id)
+
+    @staticmethod
+    def after_update(mapper, connection, target):
+        if inspect(target).attrs.main_group_id.history.has_changes():
+            group_closure.move_node(
+                connection, target.id, target.main_group_id)
 
 
 class Location(BaseMixin, db.Model):
@@ -238,8 +654,7 @@ class Location(BaseMixin, db.Model):
     city = db.Column(db.String(50), nullable=False)
     country = db.Column(db.String(50), nullable=False)
 
-    @property
-    def _descriptive(self):
+    def describe(self):
         return '{}, {} - {}'.format(
             self.street, self.city, self.country)
 
@@ -252,40 +667,51 @@ class ContactPerson(BaseMixin, db.Model):
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'))
     customer = db.relationship('Customer', backref='contactpersons')
 
+    def describe(self):
+        return '{} {}'.format(self.firstname, self.lastname)
 
-class Customer(BaseMixin, db.Model):
+
+class Customer(BaseMixin, SearchableMixin, db.Model):
     name = db.Column(db.String(50), nullable=False)
     customer_number = db.Column(db.String(50), default='')
     registration_number = db.Column(db.String(50), default='')
 
+    search_fields = (('name', 'A'),)
+    search_title = 'name'
+    search_headline = 'name'
+
     location_id = db.Column(db.Integer, db.ForeignKey('location.id'))
     location = db.relationship('Location', backref='customers')
 
-    @property
-    def _descriptive(self):
+    def describe(self):
         return '{}, {}'.format(
             self.name, self.customer_number)
 
-    def add_activity(self, new, session):
-        if not new:
-            return
+    @staticmethod
+    def after_update(mapper, connection, target):
+        if inspect(target).attrs.name.history.has_changes():
+            Project.refresh_descriptive(
+                connection, Project.customer_id == target.id)
+
+    def logs_activity(self, new):
+        return new
 
-        origin = self.name
-        target = self._descriptive
+    def activity_values(self, state):
         action = '{target} is now a customer!'
 
-        activity = Activity(**{
+        return Activity.row(**{
             'action': action,
             'customer_id': self.id,
             'target': 'customer'
         })
-        session.add(activity)
 
 
-class Project(BaseMixin, db.Model):
+class Project(BaseMixin, SearchableMixin, db.Model):
     title = db.Column(db.String(50), nullable=False)
     description = db.Column(db.String(), default='')
 
+    search_fields = (('title', 'A'), ('description', 'B'))
+
     startdate = db.Column(db.DateTime())
     enddate = db.Column(db.DateTime())
     hours = db.Column(db.Integer, default=0)
@@ -296,27 +722,50 @@ class Project(BaseMixin, db.Model):
     location_id = db.Column(db.Integer, db.ForeignKey('location.id'))
     location = db.relationship('Location', backref='projects')
 
-    @property
-    def _descriptive(self):
-        return self.title + (
-            ' @ {}'.format(self.customer.name) if self.customer != '' else '')
+    def describe(self):
+        return Project.label(
+            self.title, self.customer.name if self.customer else None)
 
-    def add_activity(self, new, session):
-        if not new:
-            return
+    @staticmethod
+    def label(title, customer_name):
+        return title + (
+            ' @ {}'.format(customer_name) if customer_name else '')
+
+    @staticmethod
+    def refresh_descriptive(connection, criterion):
+        """
+        Recomputes the stored label of the projects matching criterion, used
+        when the name of their customer changes. A single UPDATE computing
+        the same text as label().
+        """
+        project = Project.__table__
+        customer = Customer.__table__
+        suffix = select([literal(' @ ') + customer.c.name]).where(and_(
+            customer.c.id == project.c.customer_id,
+            customer.c.name != '')).as_scalar()
+        connection.execute(project.update().where(criterion).values(
+            _descriptive=project.c.title + func.coalesce(
+                suffix, '', type_=db.String)))
+
+    @staticmethod
+    def after_update(mapper, connection, target):
+        if inspect(target).attrs.title.history.has_changes():
+            ProjectResponse.refresh_descriptive(
+                connection, ProjectResponse.project_id == target.id)
+
+    def logs_activity(self, new):
+        return new
 
-        origin = self.customer.name
-        target = self.title
+    def activity_values(self, state):
         action = '{origin} added the project {target}'
 
-        activity = Activity(**{
+        return Activity.row(**{
             'action': action,
-            'customer_id': self.customer.id,
+            'customer_id': self.customer_id,
             'project_id': self.id,
             'origin': 'customer',
             'target': 'project'
         })
-        session.add(activity)
 
 
 class ProjectResponse(BaseMixin, db.Model):
@@ -332,47 +781,80 @@ class ProjectResponse(BaseMixin, db.Model):
         ResponseType,
         impl=db.String()), default=ResponseType.empty.value)
 
-    @property
-    def _descriptive(self):
+    def describe(self):
+        return ProjectResponse.label(
+            self.user.name if self.user else None,
+            self.type,
+            self.project.title if self.project else None)
+
+    @staticmethod
+    def label(user_name, type, project_title):
         return '{} - {} - {}'.format(
-            self.user.name, self.type, self.project.title)
-
-    def add_activity(self, new, session):
-        new_value = next(iter(inspect(self).attrs.type.history.added), None)
-        old_value = next(iter(inspect(self).attrs.type.history.deleted), None)
-        if old_value:
-            old_value = old_value.value
-        if not new and new_value == old_value:
-            print('uppdatera inte')
-            return
+            user_name, getattr(type, 'value', type), project_title)
 
-        origin = self.user.name
-        target = self.project._descriptive
-        if self.type == ResponseType.interested.value:
+    @staticmethod
+    def refresh_descriptive(connection, criterion):
+        """
+        Recomputes the stored label of the project responses matching
+        criterion, used when the user name or project title changes. A
+        single UPDATE computing the same text as label(), where missing
+        values format as 'None'.
+        """
+        response = ProjectResponse.__table__
+        user = User.__table__
+        project = Project.__table__
+
+        def part(value):
+            return func.coalesce(value, 'None', type_=db.String)
+
+        user_name = select([user.c.name]).where(
+            user.c.id == response.c.user_id).as_scalar()
+        title = select([project.c.title]).where(
+            project.c.id == response.c.project_id).as_scalar()
+        connection.execute(response.update().where(criterion).values(
+            _descriptive=part(user_name) + ' - ' +
+            part(cast(response.c.type, db.String)) + ' - ' + part(title)))
+
+    def logs_activity(self, new):
+        history = inspect(self).attrs.type.history
+        new_value = next(iter(history.added), None)
+        old_value = next(iter(history.deleted), None)
+        return new or \
+            getattr(new_value, 'value', new_value) != \
+            getattr(old_value, 'value', old_value)
+
+    def activity_state(self):
+        return getattr(self.type, 'value', self.type)
+
+    def activity_values(self, state):
+        # The type the response had when it was saved, not the current one
+        type = state
+        if type == ResponseType.interested.value:
             action = '{origin} is interested in the project {target}'
-        elif self.type == ResponseType.accepted.value:
+        elif type == ResponseType.accepted.value:
             action = '{origin} was accepted for the project {target}'
-        elif self.type == ResponseType.proposed.value:
+        elif type == ResponseType.proposed.value:
             action = '{origin} was proposed for the project {target}'
         else:
-            return
+            return None
 
-        activity = Activity(**{
+        return Activity.row(**{
             'action': action,
-            'user_id': self.user.id,
+            'user_id': self.user_id,
             'project_response_id': self.id,
-            'project_id': self.project.id,
+            'project_id': self.project_id,
             'origin': 'user',
             'target': 'project'
         })
-        session.add(activity)
 
 
-class Education(BaseMixin, ExperienceMixin, db.Model):
+class Education(BaseMixin, ExperienceMixin, SearchableMixin, db.Model):
     title = db.Column(db.String(50), nullable=False)
     school = db.Column(db.String(50), default='')
     extent = db.Column(db.String(50), default='')
     description = db.Column(db.String(), default='')
+
+    search_fields = (('title', 'A'), ('school', 'B'), ('description', 'C'))
     type = db.Column(ChoiceType(
         EducationType,
         impl=db.String()), default=EducationType.education.value)
@@ -384,34 +866,33 @@ class Education(BaseMixin, ExperienceMixin, db.Model):
     user = db.relationship(
         'User', foreign_keys=[user_id], backref='educations')
 
-    @property
-    def _descriptive(self):
+    def describe(self):
         return self.title + (
             ', {}'.format(self.school) if self.school != '' else '')
 
-    def add_activity(self, new, session):
-        if not new:
-            return
+    def logs_activity(self, new):
+        return new
 
-        origin = self.user.name
-        target = self._descriptive
+    def activity_values(self, state):
         action = '{origin} added the work experience {target}'
 
-        activity = Activity(**{
+        return Activity.row(**{
             'action': action,
-            'user_id': self.user.id,
+            'user_id': self.user_id,
             'education_id': self.id,
             'origin': 'user',
             'target': 'education'
         })
-        session.add(activity)
 
 
-class WorkExperience(BaseMixin, ExperienceMixin, db.Model):
+class WorkExperience(BaseMixin, ExperienceMixin, SearchableMixin, db.Model):
     title = db.Column(db.String(50), nullable=False)
     employer = db.Column(db.String(50), nullable=False)
     description = db.Column(db.String(), default='')
 
+    search_fields = (
+        ('title', 'A'), ('employer', 'B'), ('description', 'C'))
+
     startdate = db.Column(db.DateTime())
     enddate = db.Column(db.DateTime())
 
@@ -419,29 +900,22 @@ class WorkExperience(BaseMixin, ExperienceMixin, db.Model):
     user = db.relationship(
         'User', foreign_keys=[user_id], backref='work_experience')
 
-    @property
-    def _descriptive(self):
+    def describe(self):
         return '{}, {}'.format(self.title, self.employer)
 
-    def add_activity(self, new, session):
-        print(new)
-        if not new:
-            return
+    def logs_activity(self, new):
+        return new
 
-        origin = self.user.name
-        target = self._descriptive
+    def activity_values(self, state):
         action = '{origin} added the work experience {target}'
 
-        activity = Activity(**{
+        return Activity.row(**{
             'action': action,
-            'user_id': self.user.id,
+            'user_id': self.user_id,
             'work_experience_id': self.id,
             'origin': 'user',
             'target': 'work_experience'
         })
-        print(activity)
-        session.add(activity)
-        
 
 
 class Tag(db.Model):
@@ -463,8 +937,23 @@ class Tag(db.Model):
 
 
 class Activity(db.Model):
+    # Partitioned by month on created, see create_partitions. The partition
+    # key has to be part of the primary key.
+    __table_args__ = (
+        db.Index('ix_activity_user_id_created', 'user_id', 'created'),
+        db.Index('ix_activity_project_id_created', 'project_id', 'created'),
+        {'postgresql_partition_by': 'RANGE (created)'}
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    created = db.Column(db.DateTime, default=datetime.datetime.utcnow())
+    created = db.Column(
+        db.DateTime, primary_key=True, default=datetime.datetime.utcnow)
+
+    # NOTIFY channel announcing newly committed activities
+    channel = 'activity'
+    # Advisory lock serializing activity inserts, so ids become visible in
+    # order and readers paging on id > last seen never skip one
+    insert_lock = 0x61637476
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user = db.relationship('User', backref='activities')
@@ -495,22 +984,294 @@ class Activity(db.Model):
     def _descriptive(self):
         return '{} {} {}'.format(self.origin, self.action, self.target)
 
+    @staticmethod
+    def row(**values):
+        """
+        Returns a complete column dict for a multi-row insert, where every
+        row must name the same columns
+        """
+        row = {
+            'created': datetime.datetime.utcnow(),
+            'user_id': None,
+            'project_response_id': None,
+            'project_id': None,
+            'education_id': None,
+            'work_experience_id': None,
+            'customer_id': None,
+            'action': '',
+            'origin': '',
+            'target': ''
+        }
+        row.update(values)
+        return row
+
+    @staticmethod
+    def partition_name(year, month):
+        return 'activity_y{:04d}m{:02d}'.format(year, month)
+
+    @staticmethod
+    def partitions(connection):
+        """
+        :return: names of the partitions currently attached to activity
+        """
+        return set(name for name, in connection.execute(text(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'WHERE parent.relname = \'activity\'')))
+
+    @staticmethod
+    def create_partitions(connection, months_ahead):
+        """
+        Creates the monthly partitions from the current month up to
+        months_ahead months from now, skipping existing ones.
+
+        Rows of a month whose partition was missing when they were written
+        sit in activity_default, and Postgres refuses to create a partition
+        overlapping them. Those months get their partition too: the default
+        partition is detached, the rows moved over and it is attached again.
+        """
+        today = datetime.date.today()
+        months = set()
+        for offset in range(months_ahead + 1):
+            index = today.year * 12 + today.month - 1 + offset
+            months.add((index // 12, index % 12 + 1))
+        stray = set((start.year, start.month) for start, in connection.execute(
+            text('SELECT DISTINCT date_trunc(\'month\', created) '
+                 'FROM activity_default')))
+
+        existing = Activity.partitions(connection)
+        missing = [(year, month) for year, month in sorted(months | stray)
+                   if Activity.partition_name(year, month) not in existing]
+        if any(month in stray for month in missing):
+            connection.execute(text(
+                'ALTER TABLE activity DETACH PARTITION activity_default'))
+
+        for year, month in missing:
+            name = Activity.partition_name(year, month)
+            index = year * 12 + month
+            bounds = {
+                'start': datetime.datetime(year, month, 1),
+                'end': datetime.datetime(index // 12, index % 12 + 1, 1)}
+            connection.execute(text(
+                'CREATE TABLE {} PARTITION OF activity '
+                'FOR VALUES FROM (\'{:%Y-%m-%d}\') TO (\'{:%Y-%m-%d}\')'
+                .format(name, bounds['start'], bounds['end'])))
+            if (year, month) in stray:
+                connection.execute(text(
+                    'WITH moved AS (DELETE FROM activity_default '
+                    'WHERE created >= :start AND created < :end '
+                    'RETURNING *) '
+                    'INSERT INTO {} SELECT * FROM moved'.format(name)),
+                    bounds)
+
+        if any(month in stray for month in missing):
+            connection.execute(text(
+                'ALTER TABLE activity ATTACH PARTITION activity_default '
+                'DEFAULT'))
+
+    @staticmethod
+    def retention_cutoff(keep_months):
+        """
+        Returns the start of the oldest month kept by a retention of
+        keep_months months
+        """
+        today = datetime.date.today()
+        months = today.year * 12 + today.month - 1 - keep_months
+        return datetime.datetime(months // 12, months % 12 + 1, 1)
+
+    @staticmethod
+    def drop_partitions(connection, keep_months):
+        """
+        Detaches and drops the monthly partitions older than keep_months
+        months, which discards their rows without a DELETE
+        :return: names of the dropped partitions
+        """
+        cutoff = Activity.retention_cutoff(keep_months)
+        cutoff = Activity.partition_name(cutoff.year, cutoff.month)
+
+        dropped = []
+        for name in Activity.partitions(connection):
+            if not re.match(r'^activity_y\d{4}m\d{2}$', name) or \
+                    name >= cutoff:
+                continue
+            connection.execute(text(
+                'ALTER TABLE activity DETACH PARTITION {}'.format(name)))
+            connection.execute(text('DROP TABLE {}'.format(name)))
+            dropped.append(name)
+        return sorted(dropped)
+
+    @staticmethod
+    def insert_many(session, rows):
+        """
+        Inserts activities with a single multi-row INSERT, bypassing the
+        unit of work
+        :return: ids of the new activities
+        """
+        if not rows:
+            return []
+        result = session.execute(Activity.__table__.insert().values(
+            rows).returning(Activity.__table__.c.id))
+        return [row_id for row_id, in result]
+
+
+class FeedItem(db.Model):
+    """
+    Materialized home feed: one row per activity a user should see. There
+    is no foreign key to activity, partitioned tables cannot be referenced,
+    so feed rows are pruned together with old activity partitions.
+    """
+    __tablename__ = 'feed_item'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('user.id', ondelete='CASCADE'),
+        primary_key=True)
+    activity_id = db.Column(db.Integer, primary_key=True)
+    created = db.Column(db.DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def fan_out(session, activity_ids):
+        """
+        Adds the given activities to the feed of every user with a response
+        on the activity's project and of every user in the same group as
+        the user behind it, with a single INSERT ... SELECT
+        """
+        if not activity_ids:
+            return
+        activity = Activity.__table__
+        response = ProjectResponse.__table__
+        actor = User.__table__.alias('actor')
+        member = User.__table__.alias('member')
+
+        by_project = select([
+            response.c.user_id, activity.c.id, activity.c.created
+        ]).select_from(activity.join(
+            response, response.c.project_id == activity.c.project_id)).where(
+                and_(activity.c.id.in_(activity_ids),
+                     response.c.user_id.isnot(None)))
+        by_group = select([
+            member.c.id, activity.c.id, activity.c.created
+        ]).select_from(activity.join(
+            actor, actor.c.id == activity.c.user_id).join(
+                member, member.c.group_id == actor.c.group_id)).where(
+                    activity.c.id.in_(activity_ids))
+
+        session.execute(FeedItem.__table__.insert().from_select(
+            ['user_id', 'activity_id', 'created'],
+            union(by_project, by_group)))
+
+    @staticmethod
+    def prune(before):
+        deleted = FeedItem.query.filter(FeedItem.created < before).delete(
+            synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+# Rows outside every monthly partition end up here instead of failing
+event.listen(
+    Activity.__table__,
+    'after_create',
+    DDL('CREATE TABLE activity_default PARTITION OF activity DEFAULT')
+    .execute_if(dialect='postgresql'))
+
+
+# Searchable models by the type reported in search results
+searchable = {
+    'customer': Customer,
+    'project': Project,
+    'education': Education,
+    'work_experience': WorkExperience
+}
+
+for model in searchable.values():
+    for statement in model.search_ddl():
+        event.listen(
+            model.__table__,
+            'after_create',
+            DDL(statement).execute_if(dialect='postgresql'))
+
+
+class ActivityOutbox(db.Model):
+    """
+    Changes that should be logged as activities. Rows are written in the
+    same transaction as the change itself and expanded into Activity rows
+    later by `manage.py process_activity_outbox`.
+    """
+    __tablename__ = 'activity_outbox'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    target = db.Column(db.String(50), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String(50))
+
+    @staticmethod
+    def process(batch_size):
+        """
+        Expands one batch of outbox rows into activities and removes them
+        from the outbox. Rows locked by another worker are skipped.
+        :return: number of processed outbox rows
+        """
+        entries = ActivityOutbox.query.order_by(ActivityOutbox.id).limit(
+            batch_size).with_for_update(skip_locked=True).all()
+        if not entries:
+            return 0
+
+        models = {model.__tablename__: model for model in [
+            Customer, Project, ProjectResponse, Education, WorkExperience]}
+        targets = defaultdict(set)
+        for entry in entries:
+            targets[entry.target].add(entry.target_id)
+        instances = {}
+        for target, ids in targets.items():
+            model = models[target]
+            for instance in model.query.filter(model.id.in_(ids)).all():
+                instances[(target, instance.id)] = instance
+
+        rows = []
+        for entry in entries:
+            instance = instances.get((entry.target, entry.target_id))
+            values = instance.activity_values(entry.state) \
+                if instance else None
+            if values:
+                # Dated by the change, not by when the outbox was processed
+                values['created'] = entry.created
+                rows.append(values)
+        # Held until commit: a lower id can never commit after a higher one
+        # some stream has already sent
+        db.session.execute(
+            text('SELECT pg_advisory_xact_lock(:key)'),
+            {'key': Activity.insert_lock})
+        activity_ids = Activity.insert_many(db.session, rows)
+        FeedItem.fan_out(db.session, activity_ids)
+        if rows:
+            # Delivered by Postgres when the transaction commits
+            db.session.execute(text('NOTIFY {}'.format(Activity.channel)))
+        db.session.execute(ActivityOutbox.__table__.delete().where(
+            ActivityOutbox.id.in_([entry.id for entry in entries])))
+        db.session.commit()
+        return len(entries)
+
 
 # LOG ACTIVITIES
 # I.e. 'John Doe is interested in Cool project, BMW'
 # or   'Jane Doe was accepted for Cool project2, Volvo'
 @event.listens_for(db.Session, 'after_flush')
-def test(session, ctx):
-    for instance in session.dirty:
-        if not getattr(instance, 'add_activity', None):
-            print('nope')
-            continue
-        instance.add_activity(new=False, session=session)
-        print(instance)
-
-    for instance in session.new:
-        if not getattr(instance, 'add_activity', None):
-            print('nope')
-            continue
-        instance.add_activity(new=True, session=session)
-        print(instance)
+def log_activities(session, ctx):
+    entries = []
+    for new, instances in [(False, session.dirty), (True, session.new)]:
+        for instance in instances:
+            if not getattr(instance, 'logs_activity', None):
+                continue
+            if instance.logs_activity(new=new):
+                entries.append({
+                    'target': instance.__tablename__,
+                    'target_id': instance.id,
+                    'state': instance.activity_state(),
+                    'created': datetime.datetime.utcnow()
+                })
+    if entries:
+        # A single multi-row INSERT, a parameter list would be executemany
+        session.execute(ActivityOutbox.__table__.insert().values(entries))
@@ -1,4 +1,4 @@
-from marshmallow import fields
+from marshmallow import fields, pre_dump
 
 from ..models import (
     User,
@@ -16,10 +16,15 @@ from ..models import (
 )
 from ..models.enums import EducationType, ResponseType
 from project import ma
-from .custom_fields import RelatedTo, RelatedFromQuery, RelatedFromList
+from .custom_fields import (
+    RelatedTo, RelatedFromQuery, RelatedFromList, RelatedIds)
 
 
 class BaseSchema(ma.ModelSchema):
+    # Relationship paths the schema walks when serializing. List endpoints
+    # load these up front instead of lazily per row.
+    eager_load = ('created_by', 'updated_by')
+
     id = fields.Integer(dump_to='_id')
     created = fields.DateTime(dump_only=True, dump_to='_created')
     timestamp = fields.DateTime(dump_only=True, dump_to='_timestamp')
@@ -31,6 +36,8 @@ class BaseSchema(ma.ModelSchema):
 
 
 class ExtendedSchema(BaseSchema):
+    eager_load = BaseSchema.eager_load + ('user', 'tags', 'activities')
+
     user = RelatedTo(attribute='user')
     tags = fields.List(fields.Nested(
         'TagSchema', only=['title', 'id'], dump_only=True
@@ -40,32 +47,63 @@ class ExtendedSchema(BaseSchema):
 class GroupSchema(ExtendedSchema):
     class Meta:
         model = Group
+    eager_load = BaseSchema.eager_load + ('users', 'main_group', 'subgroups')
 
-    users = ma.List(ma.HyperlinkRelated(
-        'user.get_user_detail', external=True), dump_only=True)
+    users = RelatedFromQuery(
+        endpoint='user.get_user_detail', attribute='users', dump_only=True)
     main_group = RelatedTo(attribute='main_group')
-    subgroups = ma.List(ma.HyperlinkRelated(
-        'group.get_group_detail', external=True), dump_only=True)
+    subgroups = RelatedFromQuery(
+        endpoint='group.get_group_detail',
+        attribute='subgroups',
+        dump_only=True)
     _all_users = RelatedFromQuery(
         endpoint='user.get_user_detail', attribute='all_users_id')
 
+    @pre_dump(pass_many=True)
+    def preload_all_users(self, data, many):
+        if many and '_all_users' in self.fields:
+            Group.preload_all_users(data)
+        return data
+
 
 class RoleSchema(ExtendedSchema):
     class Meta:
         model = Role
+    eager_load = BaseSchema.eager_load + ('users', 'main_role', 'subroles')
     _all_users = RelatedFromQuery(
         endpoint='user.get_user_detail', attribute='all_users_id')
-    users = ma.List(ma.HyperlinkRelated(
-        'user.get_user_detail'), dump_only=True)
+    users = RelatedFromQuery(
+        endpoint='user.get_user_detail',
+        external=False,
+        attribute='users',
+        dump_only=True)
     main_role = RelatedTo(attribute='main_role')
-    subroles = ma.List(ma.HyperlinkRelated(
-        'role.get_role_detail', external=True), dump_only=True)
+    subroles = RelatedFromQuery(
+        endpoint='role.get_role_detail',
+        attribute='subroles',
+        dump_only=True)
+
+    @pre_dump(pass_many=True)
+    def preload_all_users(self, data, many):
+        if many and '_all_users' in self.fields:
+            Role.preload_all_users(data)
+        return data
 
 
 class UserSchema(BaseSchema):
     class Meta:
         model = User
-        exclude = ['password', 'updated_by', 'created_by']
+        exclude = ['password', 'token_version', 'updated_by', 'created_by']
+    eager_load = (
+        'educations',
+        'work_experience',
+        'projectresponses',
+        'group',
+        'role',
+        'location',
+        'tags',
+        'activities'
+    )
 
     updated_by_user_id = fields.Integer(dump_to='updated_by', dump_only=True)
     created_by_user_id = fields.Integer(dump_to='created_by', dump_only=True)
@@ -90,6 +128,8 @@ class UserSchema(BaseSchema):
         GroupSchema, only=['_descriptive', 'id'], dump_only=True)
     role = fields.Nested(
         RoleSchema, only=['_descriptive', 'id'], dump_only=True)
+    location = RelatedTo(attribute='location')
+    activities = RelatedIds(attribute='activities', dump_only=True)
 
     tags = fields.List(fields.Nested(
         'TagSchema', only=['title', 'id'], dump_only=True
@@ -99,6 +139,7 @@ class UserSchema(BaseSchema):
 class EducationSchema(ExtendedSchema):
     class Meta:
         model = Education
+    activities = RelatedIds(attribute='activities', dump_only=True)
     _type = fields.Method('get_type', dump_to='type', dump_only=True)
 
     @classmethod
@@ -113,13 +154,18 @@ class WorkExperienceSchema(ExtendedSchema):
     class Meta:
         model = WorkExperience
 
+    activities = RelatedIds(attribute='activities', dump_only=True)
+
 
 class ProjectSchema(BaseSchema):
     class Meta:
         model = Project
+    eager_load = BaseSchema.eager_load + (
+        'customer', 'location', 'projectresponses', 'tags', 'activities')
 
     customer = RelatedTo(attribute='customer')
     location = RelatedTo(attribute='location')
+    activities = RelatedIds(attribute='activities', dump_only=True)
     projectresponses = RelatedFromList(
         endpoint_list='project.get_project_response_list',
         endpoint_details='project_response.get_project_response_detail',
@@ -130,9 +176,12 @@ class ProjectSchema(BaseSchema):
 class ProjectResponseSchema(BaseSchema):
     class Meta:
         model = ProjectResponse
+    eager_load = BaseSchema.eager_load + (
+        'user', 'project', 'activities')
 
     user = RelatedTo(attribute='user')
     project = RelatedTo(attribute='project')
+    activities = RelatedIds(attribute='activities', dump_only=True)
     _type = fields.Method('get_type', dump_to='type', dump_only=True)
 
     @classmethod
@@ -146,6 +195,8 @@ class ProjectResponseSchema(BaseSchema):
 class LocationSchema(BaseSchema):
     class Meta:
         model = Location
+        exclude = ['users']
+    eager_load = BaseSchema.eager_load + ('customers', 'projects')
 
     customer = RelatedTo(attribute='customer')
     project = RelatedTo(attribute='project')
@@ -166,6 +217,7 @@ class LocationSchema(BaseSchema):
 class ContactPersonSchema(BaseSchema):
     class Meta:
         model = ContactPerson
+    eager_load = BaseSchema.eager_load + ('customer',)
 
     customer = RelatedTo(attribute='customer')
 
@@ -173,8 +225,11 @@ class ContactPersonSchema(BaseSchema):
 class CustomerSchema(BaseSchema):
     class Meta:
         model = Customer
+    eager_load = BaseSchema.eager_load + (
+        'location', 'projects', 'contactpersons', 'activities')
 
     location = RelatedTo(attribute='location')
+    activities = RelatedIds(attribute='activities', dump_only=True)
     projects = RelatedFromList(
         endpoint_list='customer.get_project_list',
         endpoint_details='project.get_project_detail',
@@ -185,12 +240,21 @@ class CustomerSchema(BaseSchema):
 class TagSchema(ma.ModelSchema):
     class Meta:
         model = Tag
+    eager_load = ('user', 'project', 'education', 'work_experience')
     id = fields.Integer(dump_to='_id')
 
 
 class ActivitySchema(ma.ModelSchema):
     class Meta:
         model = Activity
+    eager_load = (
+        'user',
+        'project_response',
+        'education',
+        'work_experience',
+        'customer',
+        'project'
+    )
     id = fields.Integer(dump_to='_id')
     created = fields.DateTime()
     action = fields.String(dump_to='_descriptive')
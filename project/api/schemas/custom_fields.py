@@ -1,5 +1,30 @@
 from marshmallow import fields
-from flask import url_for
+from flask import request, url_for
+
+_ID_PLACEHOLDER = 'ID_PLACEHOLDER'
+_url_templates = {}
+
+
+def url_template(endpoint, external=True):
+    """
+    Returns a format string for the url of an endpoint taking an id. The url
+    map is only consulted once per endpoint, after that links are built
+    with plain string formatting. Only the path is cached, external urls
+    prefix it with the host of the current request, which comes from the
+    client and so must not become part of a cache key.
+    """
+    template = _url_templates.get(endpoint)
+    if template is None:
+        url = url_for(endpoint, id=_ID_PLACEHOLDER)
+        template = _escape(url).replace(_ID_PLACEHOLDER, '{id}')
+        _url_templates[endpoint] = template
+    if external:
+        return _escape(request.host_url.rstrip('/')) + template
+    return template
+
+
+def _escape(text):
+    return text.replace('{', '{{').replace('}', '}}')
 
 
 class RelatedTo(fields.Field):
@@ -16,16 +41,16 @@ class RelatedTo(fields.Field):
 
 
 class RelatedFromQuery(fields.Field):
-    def __init__(self, endpoint, **kwargs):
+    def __init__(self, endpoint, external=True, **kwargs):
         super(RelatedFromQuery, self).__init__(**kwargs)
         self.endpoint = endpoint
+        self.external = external
 
     def _serialize(self, value, attr, obj):
         if not value:
             return []
-        return [url_for(
-            endpoint=self.endpoint,
-            _external=True, id=item.id) for item in value]
+        template = url_template(self.endpoint, self.external)
+        return [template.format(id=item.id) for item in value]
 
 
 class RelatedFromList(fields.Field):
@@ -35,32 +60,33 @@ class RelatedFromList(fields.Field):
         self.endpoint_details = endpoint_details
 
     def _serialize(self, value, attr, obj):
-        print(value)
-        print(attr)
-        print(obj)
-        print(self)
+        collection = url_template(self.endpoint_list).format(id=obj.id)
         if not value:
             return {
-                '_collection': url_for(
-                    endpoint=self.endpoint_list,
-                    _external=True,
-                    id=obj.id),
+                '_collection': collection,
                 '_items': []
             }
 
+        details = url_template(self.endpoint_details)
         return {
-            '_collection': url_for(
-                endpoint=self.endpoint_list,
-                _external=True,
-                id=obj.id),
-            '_items': [self.get_item_dict(item) for item in value]
+            '_collection': collection,
+            '_items': [self.get_item_dict(item, details) for item in value]
         }
 
-    def get_item_dict(self, item):
+    def get_item_dict(self, item, details):
         return {
-            'url': url_for(
-                endpoint=self.endpoint_details,
-                _external=True,
-                id=item.id),
+            'url': details.format(id=item.id),
             '_descriptive': item._descriptive
         }
+
+
+class RelatedIds(fields.Field):
+    """
+    Dumps a collection as a list of ids. Used where the auto generated field
+    would dump a dict per item because the related model has a composite
+    primary key.
+    """
+    def _serialize(self, value, attr, obj):
+        if not value:
+            return []
+        return [item.id for item in value]
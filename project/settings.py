@@ -23,7 +23,32 @@ class BaseConfig:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'very_secret')
     DEBUG = False
     BCRYPT_LOG_ROUNDS = 13
+    BCRYPT_POOL_SIZE = int(os.environ.get('BCRYPT_POOL_SIZE', 2))
+    BCRYPT_QUEUE_DEPTH = int(os.environ.get('BCRYPT_QUEUE_DEPTH', 8))
+    BCRYPT_TIMEOUT_SECONDS = 5
+    TOKEN_BLACKLIST_REFRESH_SECONDS = 300
+    TOKEN_VERSION_REFRESH_SECONDS = 5
+    AUTH_TOKEN_EXPIRATION_DAYS = int(
+        os.environ.get('AUTH_TOKEN_EXPIRATION_DAYS', 30))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PAGINATION_DEFAULT_LIMIT = 100
+    PAGINATION_MAX_LIMIT = 1000
+    SPARSE_SCHEMA_CACHE_SIZE = 256
+    STREAM_CHUNK_SIZE = 500
+    SSE_KEEPALIVE_SECONDS = 15
+    SQL_REPEAT_WARNING_THRESHOLD = 10
+    TAG_INDEX_REFRESH_SECONDS = 60
+    TAG_SUGGESTION_LIMIT = 10
+    TAG_SUGGESTION_MAX_LIMIT = 50
+    SEARCH_CONFIG = 'english'
+    MATCHING_REFRESH_SECONDS = 300
+    MATCHING_CANDIDATE_LIMIT = 20
+    MATCHING_HIGHLIGHT_WEIGHT = 1.5
+    MATCHING_TAG_WEIGHT = 0.7
+    MATCHING_DISTANCE_WEIGHT = 0.3
+    MATCHING_DISTANCE_SCALE_KM = 50
+    LOCATION_INDEX_REFRESH_SECONDS = 300
+    LOCATION_NEAREST_DEFAULT = 10
     APPLICATION_ROOT = '/api/{}'.format(api_version)
     APPLICATION_ADMIN_ROOT = '/api/admin/{}'.format(api_version)
 
@@ -0,0 +1,71 @@
+import unittest
+
+from sqlalchemy import (
+    create_engine, select, MetaData, Table, Column, Integer)
+
+from project.api.models import ClosureTable
+
+
+class ClosureTableTestCase(unittest.TestCase):
+    """
+    Closure rows kept up to date by insert_node and move_node should always
+    equal a full rebuild from the parent mapping
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Kept off db.metadata so create_all never picks these tables up
+        cls.metadata = MetaData()
+        Table('role', cls.metadata, Column('id', Integer, primary_key=True))
+        cls.closure = ClosureTable('test_closure', 'role', cls.metadata)
+        cls.rebuilt = ClosureTable(
+            'test_closure_rebuilt', 'role', cls.metadata)
+
+    def setUp(self):
+        self.connection = create_engine('sqlite://').connect()
+        self.metadata.create_all(self.connection)
+        self.parents = {1: None, 2: 1, 3: 2, 4: 1, 5: 4}
+        for node_id in sorted(self.parents):
+            self.closure.insert_node(
+                self.connection, node_id, self.parents[node_id])
+
+    def tearDown(self):
+        self.connection.close()
+
+    def pairs(self, closure):
+        c = closure.table.c
+        rows = self.connection.execute(
+            select([c.ancestor_id, c.descendant_id, c.depth]))
+        return set(tuple(row) for row in rows)
+
+    def move(self, node_id, parent_id):
+        self.closure.move_node(self.connection, node_id, parent_id)
+        self.parents[node_id] = parent_id
+
+    def assertMatchesRebuild(self):
+        self.rebuilt.rebuild(self.connection, self.parents)
+        self.assertEqual(self.pairs(self.closure), self.pairs(self.rebuilt))
+
+    def test_insert(self):
+        self.assertMatchesRebuild()
+
+    def test_move_subtree(self):
+        self.move(2, 5)
+        self.assertMatchesRebuild()
+
+    def test_move_to_root(self):
+        self.move(4, None)
+        self.assertMatchesRebuild()
+
+    def test_move_to_same_parent(self):
+        self.move(3, 2)
+        self.assertMatchesRebuild()
+
+    def test_move_root_under_node(self):
+        self.move(4, None)
+        self.move(4, 3)
+        self.assertMatchesRebuild()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from project.api.common.geo import (
+    EARTH_RADIUS_KM, haversine, unit_vectors, chord)
+
+
+class HaversineTestCase(unittest.TestCase):
+
+    def test_known_distance(self):
+        # London to Paris
+        distance = haversine(51.5074, -0.1278, [48.8566], [2.3522])
+        self.assertAlmostEqual(distance[0], 343.5, delta=1)
+
+    def test_quarter_and_half_circle(self):
+        distances = haversine(0, 0, [0, 90, 0], [0, 0, 180])
+        np.testing.assert_allclose(
+            distances,
+            [0, EARTH_RADIUS_KM * np.pi / 2, EARTH_RADIUS_KM * np.pi])
+
+    def test_missing_coordinates(self):
+        distances = haversine(0, 0, [0, np.nan], [1, np.nan])
+        self.assertFalse(np.isnan(distances[0]))
+        self.assertTrue(np.isnan(distances[1]))
+
+    def test_decimal_coordinates(self):
+        from decimal import Decimal
+        distances = haversine(
+            Decimal('51.5074'), Decimal('-0.1278'),
+            [Decimal('48.8566')], [Decimal('2.3522')])
+        self.assertAlmostEqual(distances[0], 343.5, delta=1)
+
+
+class ChordTestCase(unittest.TestCase):
+
+    def test_known_chords(self):
+        self.assertAlmostEqual(chord(0), 0)
+        self.assertAlmostEqual(chord(EARTH_RADIUS_KM * np.pi / 3), 1)
+        self.assertAlmostEqual(chord(EARTH_RADIUS_KM * np.pi), 2)
+
+    def test_capped_at_diameter(self):
+        self.assertAlmostEqual(chord(EARTH_RADIUS_KM * 10), 2)
+
+    def test_matches_unit_vectors(self):
+        points = unit_vectors([51.5074, 48.8566], [-0.1278, 2.3522])
+        distance = haversine(51.5074, -0.1278, [48.8566], [2.3522])[0]
+        self.assertAlmostEqual(
+            np.linalg.norm(points[0] - points[1]), chord(distance))
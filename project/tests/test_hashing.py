@@ -0,0 +1,39 @@
+import unittest
+
+from project import app
+from project.api.common.hashing import hash_rounds, needs_rehash
+
+HASH = '$2b$12$KIXQJl1GZ3gB0oVrGx3zEeb8cJb6iQ3Yb5Q2aVZyzF3nJm1bY6Zzu'
+
+
+class HashRoundsTestCase(unittest.TestCase):
+
+    def test_rounds(self):
+        self.assertEqual(hash_rounds(HASH), 12)
+        self.assertEqual(hash_rounds(HASH.replace('$12$', '$04$')), 4)
+
+    def test_invalid(self):
+        self.assertIsNone(hash_rounds(None))
+        self.assertIsNone(hash_rounds(''))
+        self.assertIsNone(hash_rounds('not a hash'))
+        self.assertIsNone(hash_rounds('$2b$xx$abc'))
+
+
+class NeedsRehashTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS')
+        app.config['BCRYPT_LOG_ROUNDS'] = 12
+
+    def tearDown(self):
+        app.config['BCRYPT_LOG_ROUNDS'] = self.rounds
+
+    def test_current_rounds(self):
+        self.assertFalse(needs_rehash(HASH))
+
+    def test_other_rounds(self):
+        self.assertTrue(needs_rehash(HASH.replace('$12$', '$10$')))
+        self.assertTrue(needs_rehash(HASH.replace('$12$', '$14$')))
+
+    def test_invalid(self):
+        self.assertTrue(needs_rehash('not a hash'))
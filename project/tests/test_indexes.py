@@ -0,0 +1,63 @@
+import unittest
+
+from project.api.common.indexes import SkillIndex, parse_query
+
+
+class ParseQueryTestCase(unittest.TestCase):
+
+    def test_and_binds_tighter_than_or(self):
+        self.assertEqual(
+            parse_query('Python AND kubernetes OR go'),
+            [['python', 'kubernetes'], ['go']])
+
+    def test_terms_are_normalized(self):
+        self.assertEqual(
+            parse_query('  Machine   Learning  OR SQL'),
+            [['machine learning'], ['sql']])
+
+    def test_empty_query(self):
+        self.assertEqual(parse_query(''), [])
+        self.assertEqual(parse_query(None), [])
+
+    def test_empty_term(self):
+        with self.assertRaises(ValueError):
+            parse_query('python AND')
+        with self.assertRaises(ValueError):
+            parse_query('go OR AND sql')
+
+
+class FixedSkillIndex(SkillIndex):
+
+    def __init__(self, postings):
+        super(FixedSkillIndex, self).__init__()
+        self.postings = postings
+
+    def build(self):
+        return self.postings
+
+
+class SkillIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = FixedSkillIndex({
+            'python': frozenset([1, 2, 3]),
+            'kubernetes': frozenset([2, 3]),
+            'go': frozenset([4]),
+            'sql': frozenset([1, 4])})
+
+    def test_and(self):
+        self.assertEqual(
+            self.index.search([['python', 'kubernetes']]), {2, 3})
+
+    def test_or(self):
+        self.assertEqual(
+            self.index.search([['python', 'kubernetes'], ['go']]),
+            {2, 3, 4})
+
+    def test_unknown_term(self):
+        self.assertEqual(self.index.search([['python', 'cobol']]), set())
+        self.assertEqual(self.index.search([['cobol'], ['go']]), {4})
+
+    def test_query(self):
+        self.assertEqual(
+            self.index.search(parse_query('sql AND python OR go')), {1, 4})
@@ -0,0 +1,26 @@
+import unittest
+
+from project.api.common.instrumentation import statement_shape
+
+
+class StatementShapeTestCase(unittest.TestCase):
+
+    def test_parameters(self):
+        self.assertEqual(
+            statement_shape(
+                'SELECT * FROM "user" WHERE "user".id = %(param_1)s'),
+            'SELECT * FROM "user" WHERE "user".id = ?')
+
+    def test_in_lists_of_any_length(self):
+        short = statement_shape(
+            'SELECT * FROM tag WHERE tag.id IN (%(id_1)s, %(id_2)s)')
+        long = statement_shape(
+            'SELECT * FROM tag WHERE tag.id IN '
+            '(%(id_1)s, %(id_2)s, %(id_3)s, %(id_4)s)')
+        self.assertEqual(short, long)
+        self.assertEqual(short, 'SELECT * FROM tag WHERE tag.id IN (?)')
+
+    def test_different_statements_differ(self):
+        self.assertNotEqual(
+            statement_shape('SELECT * FROM tag WHERE tag.id = %(id_1)s'),
+            statement_shape('SELECT * FROM tag WHERE tag.title = %(t_1)s'))